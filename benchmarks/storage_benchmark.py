@@ -0,0 +1,91 @@
+"""Compare the legacy REAL/TEXT invoice layout with integer cents and day numbers
+
+Usage: python -m benchmarks.storage_benchmark [row_count]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from database.db_handler import to_day
+from database.migrations import INVOICES_INDEXES, INVOICES_TABLE, LEGACY_INVOICES_TABLE
+
+def generate_rows(count, seed=42):
+    rng = random.Random(seed)
+    start = date(2015, 1, 1)
+    for i in range(count):
+        day = start + timedelta(days=rng.randrange(3650))
+        cents = rng.randrange(1000, 500000)
+        paid = rng.randrange(0, cents + 1)
+        yield (day, f"INV-{i:08d}", f"Owner {rng.randrange(200)}", cents, paid,
+               rng.choice(('Cash', 'Card', 'Bank Transfer')))
+
+
+def build(path, compact, rows):
+    conn = sqlite3.connect(path)
+    if compact:
+        conn.execute(INVOICES_TABLE.format(table='Invoices'))
+        for statement in INVOICES_INDEXES:
+            conn.execute(statement.format(schema='main'))
+        data = ((to_day(day), number, owner, cents, paid, to_day(day), method)
+                for day, number, owner, cents, paid, method in rows)
+    else:
+        conn.execute(LEGACY_INVOICES_TABLE.format(table='Invoices'))
+        conn.execute("CREATE INDEX idx_invoices_date_generated ON Invoices (date_generated)")
+        data = ((day.isoformat(), number, owner, cents / 100, paid / 100, day.isoformat(), method)
+                for day, number, owner, cents, paid, method in rows)
+    conn.executemany('''INSERT INTO Invoices (date_generated, invoice_number, owner,
+        full_amount_pending, payment_collected, date_of_payment, payment_method)
+        VALUES (?, ?, ?, ?, ?, ?, ?)''', data)
+    conn.commit()
+    conn.execute("VACUUM")
+    return conn
+
+
+def index_bytes(conn):
+    try:
+        return conn.execute('''SELECT SUM(pgsize) FROM dbstat
+            WHERE name = 'idx_invoices_date_generated' ''').fetchone()[0]
+    except sqlite3.OperationalError:
+        return None  # dbstat not compiled in
+
+
+def timed(conn, query, params, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(query, params).fetchall()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run(count):
+    rows = list(generate_rows(count))
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for compact in (False, True):
+            path = os.path.join(tmp_dir, 'compact.db' if compact else 'legacy.db')
+            conn = build(path, compact, rows)
+            low, high = '2018-01-01', '2018-12-31'
+            if compact:
+                low, high = to_day(low), to_day(high)
+            results['compact' if compact else 'legacy'] = {
+                'file_bytes': os.path.getsize(path),
+                'index_bytes': index_bytes(conn),
+                'range_scan_ms': timed(conn, '''SELECT id, date_generated, outstanding FROM Invoices
+                    WHERE date_generated BETWEEN ? AND ?''', (low, high)),
+                'sum_ms': timed(conn, '''SELECT SUM(full_amount_pending), SUM(outstanding)
+                    FROM Invoices WHERE date_generated BETWEEN ? AND ?''', (low, high)),
+            }
+            conn.close()
+
+    print(f"{'metric':<14}{'legacy':>14}{'compact':>14}")
+    for metric in ('file_bytes', 'index_bytes', 'range_scan_ms', 'sum_ms'):
+        cells = ''.join(f"{value:>14.2f}" if isinstance(value, float) else f"{str(value):>14}"
+                        for value in (results['legacy'][metric], results['compact'][metric]))
+        print(f"{metric:<14}{cells}")
+    return results
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
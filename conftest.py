@@ -0,0 +1,34 @@
+import logging
+import os
+import sys
+import pytest
+
+# Shared with the unittest-style tests, which import db_fixtures directly
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'tests'))
+from db_fixtures import copy_template  # noqa: E402
+
+# Top-level test_db.py is a version-check script that opens the real database
+collect_ignore = ['test_db.py']
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Isolated copy of the migrated template database"""
+    path = str(tmp_path / 'invoices.db')
+    copy_template(path).close()
+    return path
+
+@pytest.fixture(scope='session', autouse=True)
+def test_log_file(tmp_path_factory):
+    """Send the application log to a per-session file instead of logs/errors.log"""
+    root = logging.getLogger()
+    replaced = [h for h in root.handlers if isinstance(h, logging.FileHandler)]
+    for handler in replaced:
+        root.removeHandler(handler)
+        handler.close()
+    handler = logging.FileHandler(tmp_path_factory.mktemp('logs') / 'errors.log')
+    if replaced:
+        handler.setFormatter(replaced[0].formatter)
+    root.addHandler(handler)
+    yield handler.baseFilename
+    root.removeHandler(handler)
+    handler.close()
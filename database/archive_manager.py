@@ -0,0 +1,164 @@
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+from .db_handler import (DEFAULT_DB_PATH, INVOICE_COLUMNS, archive_path_for, from_day,
+                         open_connection, to_day)
+from .change_journal import ARCHIVE, DELETE
+from .logger import logger
+from .migrations import (INVOICES_INDEXES, INVOICES_TABLE, TEXT_TO_DAY, rebuild_table,
+                         reserve_invoice_ids, table_columns, upgrade_invoice_storage)
+
+ARCHIVE_ALIAS = 'archive'
+_COLUMN_LIST = ', '.join(INVOICE_COLUMNS)
+_BATCH_COLUMNS = ('id', 'archived_at', 'cutoff_date', 'row_count', 'min_date', 'max_date')
+ARCHIVE_BATCHES_TABLE = '''CREATE TABLE {table} (
+    id INTEGER PRIMARY KEY,
+    archived_at TEXT NOT NULL,
+    cutoff_date EPOCHDAY INTEGER NOT NULL,
+    row_count INTEGER NOT NULL,
+    min_date EPOCHDAY INTEGER,
+    max_date EPOCHDAY INTEGER
+)'''
+
+
+class ArchiveManager:
+    """Move settled invoices out of the hot Invoices table into an archive file"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, archive_path=None, retention_days=365):
+        self.db_path = db_path
+        self.archive_path = archive_path or archive_path_for(db_path)
+        self.retention_days = retention_days
+        self._archived_through = None
+        self._archive_stamp = None
+
+    def _ensure_archive_schema(self, conn):
+        """Create or upgrade the archive tables to the live Invoices layout"""
+        upgrade_invoice_storage(conn, 'main')
+        upgrade_invoice_storage(conn, ARCHIVE_ALIAS)
+        if not table_columns(conn, 'Invoices', ARCHIVE_ALIAS):
+            conn.execute(INVOICES_TABLE.format(table=f'{ARCHIVE_ALIAS}.Invoices'))
+        batch_columns = table_columns(conn, 'ArchiveBatches', ARCHIVE_ALIAS)
+        if not batch_columns:
+            conn.execute(ARCHIVE_BATCHES_TABLE.format(table=f'{ARCHIVE_ALIAS}.ArchiveBatches'))
+        elif batch_columns['max_date'] == 'TEXT':
+            day_columns = dict.fromkeys(('cutoff_date', 'min_date', 'max_date'), TEXT_TO_DAY)
+            rebuild_table(conn, 'ArchiveBatches', ARCHIVE_BATCHES_TABLE, _BATCH_COLUMNS,
+                          day_columns, ARCHIVE_ALIAS)
+        for statement in INVOICES_INDEXES:
+            conn.execute(statement.format(schema=ARCHIVE_ALIAS))
+        # New invoices must never take an id that is already archived
+        reserve_invoice_ids(conn, conn.execute(
+            f"SELECT MAX(id) FROM {ARCHIVE_ALIAS}.Invoices").fetchone()[0])
+
+    def cutoff_date(self):
+        """Day number before which settled invoices are archived"""
+        return to_day(date.today() - timedelta(days=self.retention_days))
+
+    def archive_settled(self, batch_size=500):
+        """Move fully paid invoices older than the retention age, one batch per transaction"""
+        cutoff = self.cutoff_date()
+        moved = 0
+        conn = open_connection(self.db_path, isolation_level=None)
+        try:
+            conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_ALIAS}", (self.archive_path,))
+            self._ensure_archive_schema(conn)
+            journaled = bool(table_columns(conn, 'InvoiceChanges', 'main'))
+            while True:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    ids = [row[0] for row in conn.execute(
+                        '''SELECT id FROM main.Invoices
+                           WHERE outstanding = 0 AND date_generated < ?
+                           ORDER BY id LIMIT ?''', (cutoff, batch_size))]
+                    if not ids:
+                        conn.execute("ROLLBACK")
+                        break
+                    marks = ','.join('?' * len(ids))
+                    min_date, max_date = conn.execute(
+                        f'''SELECT MIN(date_generated), MAX(date_generated)
+                            FROM main.Invoices WHERE id IN ({marks})''', ids).fetchone()
+                    conn.execute(
+                        f'''INSERT INTO {ARCHIVE_ALIAS}.Invoices ({_COLUMN_LIST})
+                            SELECT {_COLUMN_LIST} FROM main.Invoices WHERE id IN ({marks})''', ids)
+                    if journaled:
+                        # Consumers should see these rows as moved, not deleted
+                        last_seq = conn.execute("SELECT MAX(seq) FROM main.InvoiceChanges").fetchone()[0]
+                    conn.execute(f"DELETE FROM main.Invoices WHERE id IN ({marks})", ids)
+                    if journaled:
+                        conn.execute(
+                            f'''UPDATE main.InvoiceChanges SET op = '{ARCHIVE}'
+                               WHERE seq > ? AND op = '{DELETE}' AND invoice_id IN ({marks})''',
+                            (last_seq or 0, *ids))
+                    conn.execute(
+                        f'''INSERT INTO {ARCHIVE_ALIAS}.ArchiveBatches
+                            (archived_at, cutoff_date, row_count, min_date, max_date)
+                            VALUES (?, ?, ?, ?, ?)''',
+                        (datetime.now().isoformat(), cutoff, len(ids), min_date, max_date))
+                    conn.execute("COMMIT")
+                except sqlite3.Error:
+                    conn.execute("ROLLBACK")
+                    raise
+                moved += len(ids)
+            logger.info(f"Archived {moved} settled invoices older than {from_day(cutoff)}")
+            return moved
+        except sqlite3.Error as e:
+            logger.error(f"Archival failed: {str(e)}")
+            raise
+        finally:
+            conn.close()
+
+    def archived_through(self):
+        """Latest archived date_generated as a day number, or None when empty"""
+        if not os.path.exists(self.archive_path):
+            return None
+        stat = os.stat(self.archive_path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._archive_stamp:
+            conn = sqlite3.connect(f"file:{self.archive_path}?mode=ro", uri=True)
+            try:
+                row = conn.execute("SELECT MAX(max_date) FROM ArchiveBatches").fetchone()
+                self._archived_through = to_day(row[0])
+            except sqlite3.Error:
+                self._archived_through = None
+            finally:
+                conn.close()
+            self._archive_stamp = stamp
+        return self._archived_through
+
+    def batch_high_water(self, path=None):
+        """Id of the last archive batch stored in the given archive file"""
+        path = path or self.archive_path
+        if not os.path.exists(path):
+            return 0
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM ArchiveBatches").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+        finally:
+            conn.close()
+
+    def invoice_source(self, conn, start_date=None):
+        """Return the FROM clause for an invoice query starting at start_date
+
+        The archive is attached and combined with UNION ALL only when the
+        requested range reaches back into archived dates.
+        """
+        archived_through = self.archived_through()
+        if archived_through is None or (start_date and to_day(start_date) > archived_through):
+            return 'main.Invoices'
+        attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+        if ARCHIVE_ALIAS not in attached:
+            conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_ALIAS}", (self.archive_path,))
+        columns = f"{_COLUMN_LIST}, outstanding"
+        return (f"(SELECT {columns} FROM main.Invoices "
+                f"UNION ALL SELECT {columns} FROM {ARCHIVE_ALIAS}.Invoices)")
+
+
+def run_archival():
+    manager = ArchiveManager()
+    return manager.archive_settled()
+
+
+if __name__ == "__main__":
+    print(f"Archived {run_archival()} invoices")
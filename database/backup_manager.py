@@ -1,14 +1,171 @@
+import hashlib
 import sqlite3
 import os
+import re
 import shutil
+from collections import namedtuple
 from datetime import datetime
+from urllib.request import pathname2url
+from .archive_manager import ArchiveManager
+from .db_handler import (DEFAULT_DB_PATH, DETECT_TYPES, INVOICE_COLUMNS, open_connection,
+                         to_day, transaction)
 from .logger import logger
+from .migrations import LEGACY_INVOICE_EXPRESSIONS, table_columns
+
+SNAPSHOT_ALIAS = 'snapshot'
+CATALOG_NAME = 'catalog.db'
+CATALOG_TABLE = '''CREATE TABLE IF NOT EXISTS Backups (
+    id INTEGER PRIMARY KEY,
+    file_name TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    schema_version INTEGER,
+    invoice_count INTEGER,
+    min_date EPOCHDAY INTEGER,
+    max_date EPOCHDAY INTEGER
+)'''
+_BACKUP_NAME = re.compile(r'(invoice|archive)_backup_(\d{8}_\d{6})(?:_(manual|auto))?\.db$')
+
+
+class BackupDiff(namedtuple('BackupDiff', 'added removed changed')):
+    """Invoice ids added, removed or changed in the live database since a backup"""
+    __slots__ = ()
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+
+class RestoreConflict(ValueError):
+    """Restored invoices would take invoice numbers now used by other live invoices"""
+
+    def __init__(self, conflicts):
+        super().__init__("Invoice numbers now used by other invoices: " + ', '.join(
+            f"{number} (backup #{backup_id}, live #{live_id})" for backup_id, number, live_id in conflicts))
+        self.conflicts = conflicts  # (backup id, invoice_number, live id)
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_columns(conn, schema=SNAPSHOT_ALIAS):
+    """Expressions reading a backup's Invoices in the current encoding
+
+    Backups taken before the integer-storage migration hold REAL amounts and
+    ISO dates; they are converted on the fly.
+    """
+    columns = table_columns(conn, 'Invoices', schema)
+    if not columns:
+        raise ValueError("Backup has no Invoices table")
+    legacy = not columns['full_amount_pending'].startswith('CENTS')
+    return {column: (LEGACY_INVOICE_EXPRESSIONS.get(column, '{0}') if legacy else '{0}').format(column)
+            for column in INVOICE_COLUMNS}
 
 class BackupManager:
-    def __init__(self, db_path='database/invoices.db', backup_dir='backups'):
+    def __init__(self, db_path=DEFAULT_DB_PATH, backup_dir='backups', archive_path=None):
         self.db_path = db_path
         self.backup_dir = backup_dir
+        self.archive = ArchiveManager(db_path, archive_path)
         os.makedirs(self.backup_dir, exist_ok=True)
+        self.catalog_path = os.path.join(self.backup_dir, CATALOG_NAME)
+
+    def catalog(self):
+        """Connection to the backup index, built from backup_dir on first use"""
+        created = not os.path.exists(self.catalog_path)
+        conn = sqlite3.connect(self.catalog_path, detect_types=DETECT_TYPES)
+        conn.row_factory = sqlite3.Row
+        conn.execute(CATALOG_TABLE)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_backups_created_at ON Backups (kind, created_at)")
+        if created:
+            self._sync_catalog(conn)
+        return conn
+
+    def _describe(self, path):
+        """Catalog values for one backup file"""
+        with sqlite3.connect(path) as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            count = min_date = max_date = None
+            if table_columns(conn, 'Invoices'):
+                date_generated = snapshot_columns(conn, 'main')['date_generated']
+                count, min_date, max_date = conn.execute(
+                    f"SELECT COUNT(*), MIN({date_generated}), MAX({date_generated}) FROM Invoices").fetchone()
+        conn.close()
+        return (os.path.getsize(path), file_checksum(path), version, count, min_date, max_date)
+
+    def _record(self, conn, path, kind, created_at):
+        conn.execute('''INSERT OR REPLACE INTO Backups (file_name, kind, created_at, size_bytes,
+            sha256, schema_version, invoice_count, min_date, max_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (os.path.basename(path), kind, created_at, *self._describe(path)))
+
+    def record_backup(self, path, kind, created_at=None):
+        created_at = created_at or datetime.now().isoformat(timespec='seconds')
+        with self.catalog() as conn:
+            self._record(conn, path, kind, created_at)
+        conn.close()
+
+    def _sync_catalog(self, conn):
+        known = {row['file_name'] for row in conn.execute("SELECT file_name FROM Backups")}
+        present = set()
+        for name in sorted(os.listdir(self.backup_dir)):
+            match = _BACKUP_NAME.match(name)
+            if not match:
+                continue
+            present.add(name)
+            if name in known:
+                continue
+            source, stamp, backup_type = match.groups()
+            created_at = datetime.strptime(stamp, "%Y%m%d_%H%M%S").isoformat()
+            try:
+                self._record(conn, os.path.join(self.backup_dir, name),
+                             'archive' if source == 'archive' else backup_type, created_at)
+            except sqlite3.Error as e:
+                logger.error(f"Skipping unreadable backup {name}: {str(e)}")
+        for name in known - present:
+            conn.execute("DELETE FROM Backups WHERE file_name = ?", (name,))
+        conn.commit()
+
+    def rebuild_catalog(self):
+        """Index backups copied into backup_dir by hand and forget deleted ones"""
+        with self.catalog() as conn:
+            self._sync_catalog(conn)
+        conn.close()
+
+    def list_backups(self, kinds=('manual', 'auto')):
+        """Catalog rows, newest first"""
+        marks = ', '.join('?' * len(kinds))
+        with self.catalog() as conn:
+            rows = conn.execute(f"""SELECT * FROM Backups WHERE kind IN ({marks})
+                ORDER BY created_at DESC, id DESC""", tuple(kinds)).fetchall()
+        conn.close()
+        return rows
+
+    def backup_path(self, entry):
+        return os.path.join(self.backup_dir, entry['file_name'])
+
+    def backup_at(self, when):
+        """Path of the newest database backup taken at or before ``when`` (datetime or ISO string)"""
+        when = when.isoformat(timespec='seconds') if isinstance(when, datetime) else when
+        with self.catalog() as conn:
+            row = conn.execute("""SELECT file_name FROM Backups
+                WHERE kind IN ('manual', 'auto') AND created_at <= ?
+                ORDER BY created_at DESC, id DESC LIMIT 1""", (when,)).fetchone()
+        conn.close()
+        return self.backup_path(row) if row else None
+
+    def verify_backup(self, backup_path):
+        """True when the file still matches the checksum recorded in the catalog"""
+        with self.catalog() as conn:
+            row = conn.execute("SELECT sha256 FROM Backups WHERE file_name = ?",
+                               (os.path.basename(backup_path),)).fetchone()
+        conn.close()
+        return bool(row) and os.path.exists(backup_path) and file_checksum(backup_path) == row['sha256']
         
     def create_backup(self, manual=False):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -17,14 +174,38 @@ class BackupManager:
                                  f"invoice_backup_{timestamp}_{backup_type}.db")
         
         try:
-            with sqlite3.connect(self.db_path) as src:
+            with open_connection(self.db_path) as src:
                 with sqlite3.connect(backup_path) as dst:
                     src.backup(dst)
             logger.info(f"Backup created: {backup_path}")
+            self.record_backup(backup_path, backup_type)
+            self.backup_archive(timestamp)
             return backup_path  # Return actual path string
         except Exception as e:
             logger.error(f"Backup failed: {str(e)}")
             return None  # Explicit None instead of False
+
+    def latest_archive_backup(self):
+        backups = self.list_backups(kinds=('archive',))
+        return self.backup_path(backups[0]) if backups else None
+
+    def backup_archive(self, timestamp=None):
+        """Copy the archive only when batches were added since its last backup"""
+        current = self.archive.batch_high_water()
+        if not current:
+            return None
+        latest = self.latest_archive_backup()
+        if latest and self.archive.batch_high_water(latest) == current:
+            logger.info("Archive unchanged since last backup, skipping")
+            return None
+        timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup_path = os.path.join(self.backup_dir, f"archive_backup_{timestamp}.db")
+        with sqlite3.connect(self.archive.archive_path) as src:
+            with sqlite3.connect(backup_path) as dst:
+                src.backup(dst)
+        logger.info(f"Archive backup created: {backup_path}")
+        self.record_backup(backup_path, 'archive')
+        return backup_path
             
     def restore_backup(self, backup_path):
         if not backup_path or not os.path.exists(str(backup_path)):
@@ -32,7 +213,7 @@ class BackupManager:
             
         try:
             with sqlite3.connect(backup_path) as src: 
-                with sqlite3.connect(self.db_path) as dst:
+                with open_connection(self.db_path) as dst:
                     src.backup(dst)
             logger.info(f"Database restored from: {backup_path}")
             return True
@@ -40,6 +221,112 @@ class BackupManager:
             logger.error(f"Restore failed: {str(e)}")
             return False
 
+    def _attach(self, backup_path):
+        """Live connection with the backup attached read-only as ``snapshot``"""
+        if not backup_path or not os.path.exists(str(backup_path)):
+            raise ValueError(f"Invalid backup path: {backup_path}")
+        conn = open_connection(self.db_path, isolation_level=None, uri=True)
+        uri = f"file:{pathname2url(os.path.abspath(backup_path))}?mode=ro"
+        conn.execute(f"ATTACH DATABASE ? AS {SNAPSHOT_ALIAS}", (uri,))
+        return conn
+
+    @staticmethod
+    def _selection(columns, invoice_ids=None, start_date=None, end_date=None):
+        """WHERE clause and parameters selecting invoices by id and/or date range"""
+        clause, params = " WHERE 1=1", []
+        if invoice_ids is not None:
+            invoice_ids = list(invoice_ids)
+            clause += f" AND {columns['id']} IN ({', '.join('?' * len(invoice_ids))})"
+            params += invoice_ids
+        if start_date is not None:
+            clause += f" AND {columns['date_generated']} >= ?"
+            params.append(to_day(start_date))
+        if end_date is not None:
+            clause += f" AND {columns['date_generated']} <= ?"
+            params.append(to_day(end_date))
+        return clause, params
+
+    def restore_invoices(self, backup_path, invoice_ids=None, start_date=None, end_date=None,
+                         delete_missing=False):
+        """Copy selected invoices from a backup into the live database
+
+        Other connections keep working; only the final write transaction
+        takes the lock. Selected invoices present in the backup overwrite the
+        live rows with the same id. With ``delete_missing`` live invoices in
+        the selection that did not exist at backup time are removed too.
+        Raises RestoreConflict, changing nothing, when a restored invoice
+        number now belongs to another live invoice. Returns the number of
+        invoices restored, or None on failure.
+        """
+        conn = self._attach(backup_path)
+        try:
+            source = snapshot_columns(conn)
+            live = {column: column for column in INVOICE_COLUMNS}
+            source_clause, source_params = self._selection(source, invoice_ids, start_date, end_date)
+            live_clause, live_params = self._selection(live, invoice_ids, start_date, end_date)
+            updates = ', '.join(f"{column} = excluded.{column}" for column in INVOICE_COLUMNS[1:])
+            with transaction(conn, 'restore'):
+                removed = 0
+                if delete_missing:
+                    removed = conn.execute(f"""DELETE FROM main.Invoices{live_clause}
+                        AND id NOT IN (SELECT id FROM {SNAPSHOT_ALIAS}.Invoices)""",
+                        live_params).rowcount
+                conflicts = conn.execute(f"""SELECT restored.id, restored.invoice_number, live.id
+                    FROM (SELECT {source['id']} AS id, {source['invoice_number']} AS invoice_number
+                          FROM {SNAPSHOT_ALIAS}.Invoices{source_clause}) AS restored
+                    JOIN main.Invoices AS live
+                      ON live.invoice_number = restored.invoice_number AND live.id != restored.id
+                    ORDER BY restored.id""", source_params).fetchall()
+                if conflicts:
+                    raise RestoreConflict(conflicts)
+                # An upsert on id only: OR REPLACE would also delete rows sharing the invoice number
+                restored = conn.execute(f"""INSERT INTO main.Invoices ({', '.join(INVOICE_COLUMNS)})
+                    SELECT {', '.join(source.values())} FROM {SNAPSHOT_ALIAS}.Invoices{source_clause}
+                    ON CONFLICT (id) DO UPDATE SET {updates}""", source_params).rowcount
+                # Updating payment_collected fired update_payment_dates, which stamps
+                # today's date; put the payment dates from the backup back
+                conn.execute(f"""UPDATE main.Invoices SET (date_of_payment, date_of_last_payment) =
+                    (SELECT {source['date_of_payment']}, {source['date_of_last_payment']}
+                     FROM {SNAPSHOT_ALIAS}.Invoices WHERE {SNAPSHOT_ALIAS}.Invoices.id = main.Invoices.id)
+                    WHERE id IN (SELECT id FROM {SNAPSHOT_ALIAS}.Invoices{source_clause})""",
+                    source_params)
+            logger.info(f"Restored {restored} invoices from {backup_path}"
+                        + (f", removed {removed} newer ones" if removed else ""))
+            return restored
+        except RestoreConflict as e:
+            logger.error(f"Selective restore refused: {str(e)}")
+            raise
+        except sqlite3.Error as e:
+            logger.error(f"Selective restore failed: {str(e)}")
+            return None
+        finally:
+            conn.close()
+
+    def diff(self, backup_path, invoice_ids=None, start_date=None, end_date=None):
+        """Compare a backup with the live invoices; returns a BackupDiff of ids"""
+        conn = self._attach(backup_path)
+        try:
+            source = snapshot_columns(conn)
+            source_clause, source_params = self._selection(source, invoice_ids, start_date, end_date)
+            live_clause, live_params = self._selection(
+                {column: column for column in INVOICE_COLUMNS}, invoice_ids, start_date, end_date)
+            conn.execute("CREATE TEMP TABLE backup_rows AS SELECT "
+                         + ', '.join(f"{expr} AS {column}" for column, expr in source.items())
+                         + f" FROM {SNAPSHOT_ALIAS}.Invoices{source_clause}", source_params)
+            conn.execute(f"""CREATE TEMP TABLE live_rows AS
+                SELECT {', '.join(INVOICE_COLUMNS)} FROM main.Invoices{live_clause}""", live_params)
+
+            def ids(sql):
+                return [row[0] for row in conn.execute(sql)]
+            return BackupDiff(
+                added=ids("SELECT id FROM live_rows WHERE id NOT IN (SELECT id FROM backup_rows) ORDER BY id"),
+                removed=ids("SELECT id FROM backup_rows WHERE id NOT IN (SELECT id FROM live_rows) ORDER BY id"),
+                changed=ids("""SELECT id FROM (SELECT * FROM live_rows EXCEPT SELECT * FROM backup_rows)
+                    WHERE id IN (SELECT id FROM backup_rows) ORDER BY id"""),
+            )
+        finally:
+            conn.close()
+
 def create_daily_backup():
     manager = BackupManager()
     return manager.create_backup()
@@ -0,0 +1,116 @@
+from collections import namedtuple
+from datetime import datetime
+from .db_handler import DEFAULT_DB_PATH, DETECT_TYPES, open_connection, transaction
+from .logger import logger
+
+INSERT, UPDATE, DELETE, ARCHIVE = 'I', 'U', 'D', 'A'
+
+
+class Change(namedtuple('Change', 'seq invoice_id op changed_at')):
+    """One journal entry; ARCHIVE means the row moved to the archive file unchanged"""
+    __slots__ = ()
+
+
+class ChangesCompacted(Exception):
+    """The consumer's cursor points at entries that were already compacted away"""
+
+    def __init__(self, after, compacted_through):
+        super().__init__(f"Changes {after + 1}..{compacted_through} were compacted, "
+                         "a full resync is needed")
+        self.after = after
+        self.compacted_through = compacted_through
+
+
+class ChangeJournal:
+    """Read and compact the InvoiceChanges log written by triggers
+
+    Every insert, update and delete on Invoices appends an entry with an
+    increasing ``seq``, whichever code path made the change. Consumers keep
+    a named cursor: read ``changes_after(cursor)``, process them, then
+    ``commit(name, seq)``. ``compact`` removes entries every consumer has
+    committed past.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._conn = None
+
+    @property
+    def connection(self):
+        if self._conn is None:
+            self._conn = open_connection(self.db_path, isolation_level=None,
+                                         detect_types=DETECT_TYPES)
+        return self._conn
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def latest_seq(self):
+        row = self.connection.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'InvoiceChanges'").fetchone()
+        return row[0] if row else 0
+
+    def compacted_through(self):
+        """Highest sequence number no longer in the log"""
+        first = self.connection.execute("SELECT MIN(seq) FROM InvoiceChanges").fetchone()[0]
+        return first - 1 if first is not None else self.latest_seq()
+
+    def changes_after(self, after=0, upto=None, batch_size=500):
+        """Stream entries with after < seq <= upto in order, a batch of rows at a time"""
+        compacted = self.compacted_through()
+        if after < compacted:
+            raise ChangesCompacted(after, compacted)
+        upto = self.latest_seq() if upto is None else upto
+        while after < upto:
+            rows = self.connection.execute('''SELECT seq, invoice_id, op, changed_at
+                FROM InvoiceChanges WHERE seq > ? AND seq <= ?
+                ORDER BY seq LIMIT ?''', (after, upto, batch_size)).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                yield Change(*row)
+            after = rows[-1][0]
+
+    def net_changes(self, after=0, upto=None):
+        """Last operation per invoice id in (after, upto], as {invoice_id: op}"""
+        compacted = self.compacted_through()
+        if after < compacted:
+            raise ChangesCompacted(after, compacted)
+        upto = self.latest_seq() if upto is None else upto
+        return dict(self.connection.execute('''SELECT invoice_id, op FROM InvoiceChanges
+            WHERE seq IN (SELECT MAX(seq) FROM InvoiceChanges
+                          WHERE seq > ? AND seq <= ? GROUP BY invoice_id)''', (after, upto)))
+
+    def cursor(self, consumer):
+        """Last sequence number the consumer committed, or None if it never ran"""
+        row = self.connection.execute("SELECT seq FROM ChangeCursors WHERE consumer = ?",
+                                      (consumer,)).fetchone()
+        return row[0] if row else None
+
+    def commit(self, consumer, seq):
+        """Record that the consumer has processed everything up to seq"""
+        self.connection.execute('''INSERT INTO ChangeCursors (consumer, seq, updated_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT (consumer) DO UPDATE SET seq = MAX(seq, excluded.seq),
+                updated_at = excluded.updated_at''',
+            (consumer, seq, datetime.now().isoformat()))
+
+    def forget(self, consumer):
+        """Drop a consumer that no longer runs, so it stops holding back compaction"""
+        self.connection.execute("DELETE FROM ChangeCursors WHERE consumer = ?", (consumer,))
+
+    def compact(self, upto=None):
+        """Delete entries consumed by every registered consumer; returns the count removed"""
+        conn = self.connection
+        with transaction(conn, 'compact'):
+            if upto is None:
+                upto = conn.execute("SELECT MIN(seq) FROM ChangeCursors").fetchone()[0]
+                if upto is None:
+                    return 0
+            removed = conn.execute("DELETE FROM InvoiceChanges WHERE seq <= ?", (upto,)).rowcount
+        if removed:
+            logger.info(f"Compacted {removed} change journal entries through {upto}")
+        return removed
+
@@ -1,10 +1,89 @@
+import os
 import sqlite3
 import logging
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP
 from typing import Optional
 
+# Override with CLINIC_DB_PATH, e.g. to point a test run at an isolated copy
+DEFAULT_DB_PATH = os.environ.get('CLINIC_DB_PATH', 'database/invoices.db')
+
+def archive_path_for(db_path):
+    """Archive file kept next to a database, e.g. database/invoices_archive.db"""
+    if db_path.startswith('file:'):
+        db_path = db_path[len('file:'):].split('?', 1)[0]
+    root, ext = os.path.splitext(db_path)
+    return f"{root}_archive{ext or '.db'}"
+
+# Re-exported so callers can catch database errors without importing sqlite3
+DatabaseError = sqlite3.DatabaseError
+
+# Stored (non-generated) columns of the Invoices table, in declaration order
+INVOICE_COLUMNS = (
+    'id', 'date_generated', 'invoice_number', 'owner',
+    'full_amount_pending', 'payment_collected', 'date_of_payment',
+    'date_of_last_payment', 'payment_method'
+)
+
+# Money is stored as integer cents, dates as integer days since 1970-01-01
+MONEY_COLUMNS = ('full_amount_pending', 'payment_collected', 'outstanding')
+DATE_COLUMNS = ('date_generated', 'date_of_payment', 'date_of_last_payment')
+_EPOCH = date(1970, 1, 1)
+_CENT = Decimal('0.01')
+
+def to_cents(value):
+    """Convert a decimal amount (str, float, Decimal) to integer minor units"""
+    if value is None or value == '':
+        return None
+    return int((Decimal(str(value)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_cents(value):
+    if value is None:
+        return None
+    return (Decimal(int(value)) * _CENT).quantize(_CENT)
+
+def to_day(value):
+    """Convert an ISO date/datetime string or date object to a day number"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, datetime):
+        value = value.date()
+    elif isinstance(value, str):
+        value = datetime.fromisoformat(value.strip().replace(' ', 'T')).date()
+    return (value - _EPOCH).days
+
+def from_day(value):
+    if value is None:
+        return None
+    return date.fromordinal(_EPOCH.toordinal() + int(value)).isoformat()
+
+def encode_invoice(values: dict) -> dict:
+    """Encode decimal amounts and ISO dates of an invoice mapping for storage"""
+    encoded = dict(values)
+    for column in MONEY_COLUMNS:
+        if column in encoded:
+            encoded[column] = to_cents(encoded[column])
+    for column in DATE_COLUMNS:
+        if column in encoded:
+            encoded[column] = to_day(encoded[column])
+    return encoded
+
+# Columns declared as "CENTS INTEGER" / "EPOCHDAY INTEGER" are decoded on read
+DETECT_TYPES = sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+sqlite3.register_converter('CENTS', lambda raw: from_cents(int(raw)))
+sqlite3.register_converter('EPOCHDAY', lambda raw: from_day(int(raw)))
+
+def open_connection(db_path: str, **kwargs) -> sqlite3.Connection:
+    """Connect to a file path or a 'file:' URI (e.g. a shared in-memory database)"""
+    kwargs.setdefault('uri', db_path.startswith('file:'))
+    return sqlite3.connect(db_path, **kwargs)
+
 class DBHandler:
-    def __init__(self, db_path: str = 'database/invoices.db'):
-        self.db_path = db_path
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or DEFAULT_DB_PATH
         self.connection: Optional[sqlite3.Connection] = None
         logging.basicConfig(
             filename='database/db_errors.log',
@@ -21,7 +100,7 @@ class DBHandler:
 
     def connect(self):
         try:
-            self.connection = sqlite3.connect(self.db_path)
+            self.connection = open_connection(self.db_path, detect_types=DETECT_TYPES)
             self.connection.row_factory = sqlite3.Row
             self._enable_foreign_keys()
         except sqlite3.Error as e:
@@ -50,28 +129,18 @@ class DBHandler:
             finally:
                 self.connection = None
 
-def get_db_connection():
+@contextmanager
+def transaction(conn: sqlite3.Connection, name: str = 'txn'):
+    """Run a block atomically using a savepoint, whatever the isolation level"""
+    conn.execute(f"SAVEPOINT {name}")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute(f"ROLLBACK TO {name}")
+        conn.execute(f"RELEASE {name}")
+        raise
+    conn.execute(f"RELEASE {name}")
+
+def get_db_connection(db_path: Optional[str] = None):
     """Create and return a new DBHandler instance"""
-    return DBHandler()
-
-def validate_db_schema(connection: sqlite3.Connection):
-    """Validate core database schema exists"""
-    required_tables = {'Invoices'}
-    required_triggers = {
-        'update_outstanding_insert',
-        'update_outstanding_update', 
-        'update_last_payment_date'
-    }
-    
-    tables = {row[0] for row in 
-        connection.execute("SELECT name FROM sqlite_master WHERE type='table'")}
-    triggers = {row[0] for row in 
-        connection.execute("SELECT name FROM sqlite_master WHERE type='trigger'")}
-
-    missing_tables = required_tables - tables
-    missing_triggers = required_triggers - triggers
-    
-    if missing_tables:
-        raise RuntimeError(f"Missing tables: {', '.join(missing_tables)}")
-    if missing_triggers:
-        raise RuntimeError(f"Missing triggers: {', '.join(missing_triggers)}")
+    return DBHandler(db_path)
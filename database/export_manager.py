@@ -3,24 +3,38 @@ import pandas as pd
 import sqlite3
 from pathlib import Path
 from datetime import datetime
-from .db_handler import logger
+from .archive_manager import ArchiveManager
+from .change_journal import ARCHIVE, DELETE, ChangeJournal, ChangesCompacted
+from .db_handler import DATE_COLUMNS, DEFAULT_DB_PATH, DETECT_TYPES, MONEY_COLUMNS, open_connection
+from .logger import logger
 
 class ExportManager:
-    def __init__(self, db_path='database/invoices.db'):
+    def __init__(self, db_path=DEFAULT_DB_PATH, archive_path=None, settings=None):
         self.db_path = db_path
+        self.archive = ArchiveManager(db_path, archive_path)
+        # AppSettings to format money and dates for people; None keeps raw values
+        self.settings = settings
+
+    def _format(self, df):
+        if self.settings is not None:
+            for column in df.columns:
+                if column in MONEY_COLUMNS or column in DATE_COLUMNS:
+                    df[column] = df[column].map(self.settings.formatter_for(column), na_action='ignore')
+        return df
         
-    def export_to_csv(self, invoice_number=None, output_path=None):
-        conn = sqlite3.connect(self.db_path)
+    def export_to_csv(self, invoice_number=None, output_path=None, include_archive=False):
+        conn = open_connection(self.db_path, detect_types=DETECT_TYPES)
         conn.row_factory = sqlite3.Row
         
         try:
-            query = "SELECT * FROM Invoices"
+            source = self.archive.invoice_source(conn) if include_archive else 'Invoices'
+            query = f"SELECT * FROM {source}"
             params = ()
             if invoice_number:
                 query += " WHERE invoice_number = ?"
                 params = (invoice_number,)
                 
-            df = pd.read_sql_query(query, conn, params=params)
+            df = self._format(pd.read_sql_query(query, conn, params=params))
             
             if output_path is None:
                 output_path = Path('reports') / f"invoices_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
@@ -36,18 +50,19 @@ class ExportManager:
         finally:
             conn.close()
 
-    def export_to_excel(self, invoice_number=None, output_path=None):
-        conn = sqlite3.connect(self.db_path)
+    def export_to_excel(self, invoice_number=None, output_path=None, include_archive=False):
+        conn = open_connection(self.db_path, detect_types=DETECT_TYPES)
         conn.row_factory = sqlite3.Row
         
         try:
-            query = "SELECT * FROM Invoices"
+            source = self.archive.invoice_source(conn) if include_archive else 'Invoices'
+            query = f"SELECT * FROM {source}"
             params = ()
             if invoice_number:
                 query += " WHERE invoice_number = ?"
                 params = (invoice_number,)
                 
-            df = pd.read_sql_query(query, conn, params=params)
+            df = self._format(pd.read_sql_query(query, conn, params=params))
             
             if output_path is None:
                 output_path = Path('reports') / f"invoices_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
@@ -62,3 +77,65 @@ class ExportManager:
             raise
         finally:
             conn.close()
+
+    def export_changes(self, consumer='export', fmt='csv', output_path=None, include_archive=False):
+        """Export only the invoices changed since this consumer's previous run
+
+        Rows get a leading ``change`` column, 'upsert' or 'delete'. The first
+        run, or one whose position was compacted out of the change journal,
+        exports every invoice as an upsert. Returns the file path, or None
+        when nothing changed.
+        """
+        journal = ChangeJournal(self.db_path)
+        conn = journal.connection
+        try:
+            source = self.archive.invoice_source(conn) if include_archive else 'main.Invoices'
+            conn.execute("BEGIN")  # rows and journal position from one snapshot
+            upto = journal.latest_seq()
+            after = journal.cursor(consumer)
+            changes = None
+            if after is not None:
+                try:
+                    changes = journal.net_changes(after, upto)
+                except ChangesCompacted as e:
+                    logger.warning(f"Full export for {consumer}: {str(e)}")
+
+            if changes is None:
+                df = pd.read_sql_query(f"SELECT 'upsert' AS change, * FROM {source}", conn)
+            else:
+                # Archived rows still exist when the archive is included
+                gone = (DELETE,) if include_archive else (DELETE, ARCHIVE)
+                deleted = [i for i, op in changes.items() if op in gone]
+                upserted = [i for i, op in changes.items() if op not in gone]
+                if not deleted and not upserted:
+                    logger.info(f"No invoice changes for {consumer} since {after}")
+                    return None
+                frames = [pd.DataFrame({'change': 'delete', 'id': deleted})]
+                for start in range(0, len(upserted), 500):
+                    chunk = upserted[start:start + 500]
+                    frames.append(pd.read_sql_query(
+                        f"SELECT 'upsert' AS change, * FROM {source} "
+                        f"WHERE id IN ({','.join('?' * len(chunk))})", conn, params=chunk))
+                df = pd.concat(frames, ignore_index=True)
+            conn.execute("COMMIT")
+            df = self._format(df)
+
+            if output_path is None:
+                output_path = Path('reports') / f"invoices_changes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+            output_path = Path(output_path)
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            if fmt == 'xlsx':
+                df.to_excel(output_path, index=False, engine='openpyxl')
+            else:
+                df.to_csv(output_path, index=False, quoting=csv.QUOTE_ALL)
+            journal.commit(consumer, upto)
+            logger.info(f"Exported {len(df)} changed invoices for {consumer} to {output_path}")
+            return str(output_path)
+
+        except Exception as e:
+            logger.error(f"Incremental export failed: {str(e)}")
+            raise
+        finally:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            journal.close()
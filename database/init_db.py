@@ -1,24 +1,24 @@
+import os
 import sqlite3
 import sys
 
+# Allow `python database/init_db.py` as well as `python -m database.init_db`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.db_handler import DEFAULT_DB_PATH
+from database.migrations import migrate_database
+
 def init_database():
     try:
-        conn = sqlite3.connect('database/invoices.db')
-        with open('database/schema.sql', 'r') as f:
-            schema = f.read()
-        conn.executescript(schema)
-        conn.commit()
-        print("Database initialized successfully")
+        applied = migrate_database(DEFAULT_DB_PATH,
+                                   progress=lambda step, done, total: print(f"{step}: {done}/{total}"))
+        print(f"Database initialized successfully ({applied} migrations applied)")
         return True
     except sqlite3.Error as e:
         print(f"SQLite error: {e}", file=sys.stderr)
         return False
-    except FileNotFoundError:
-        print("Schema file not found", file=sys.stderr)
+    except RuntimeError as e:
+        print(f"Migration error: {e}", file=sys.stderr)
         return False
-    finally:
-        if conn:
-            conn.close()
 
 if __name__ == "__main__":
     if init_database():
@@ -0,0 +1,189 @@
+import sqlite3
+from collections import OrderedDict, namedtuple
+from datetime import date
+from .archive_manager import ArchiveManager
+from .db_handler import DEFAULT_DB_PATH, DETECT_TYPES, from_cents, open_connection, to_cents, to_day
+from .logger import logger
+from .models import INVOICE_FIELDS, Invoice
+from .unit_of_work import UnitOfWork
+
+_FIELD_LIST = ', '.join(INVOICE_FIELDS)
+
+
+class InvoiceFilter(namedtuple('InvoiceFilter',
+                               'start_date end_date owner payment_method max_outstanding')):
+    """Normalized invoice list filter, usable as a cache key"""
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, start_date=None, end_date=None, owner=None, payment_method=None,
+              max_outstanding=None):
+        """Normalize raw form input; raises ValueError/ArithmeticError when invalid"""
+        def clean(value):
+            value = value.strip() if isinstance(value, str) else value
+            return value or None
+
+        start_date, end_date = clean(start_date), clean(end_date)
+        if start_date and end_date:
+            start_date = date.fromisoformat(start_date).isoformat()
+            end_date = date.fromisoformat(end_date).isoformat()
+        else:
+            start_date = end_date = None  # a range needs both ends
+        max_outstanding = clean(max_outstanding)
+        if max_outstanding is not None:
+            max_outstanding = from_cents(to_cents(max_outstanding))
+        return cls(start_date, end_date, clean(owner), clean(payment_method), max_outstanding)
+
+    def where(self):
+        """SQL conditions and encoded parameters for this filter"""
+        clause, params = " WHERE 1=1", []
+        if self.start_date:
+            clause += " AND date_generated BETWEEN ? AND ?"
+            params.extend([to_day(self.start_date), to_day(self.end_date)])
+        if self.owner:
+            clause += " AND owner = ?"
+            params.append(self.owner)
+        if self.payment_method:
+            clause += " AND payment_method = ?"
+            params.append(self.payment_method)
+        if self.max_outstanding is not None:
+            clause += " AND outstanding <= ?"
+            params.append(to_cents(self.max_outstanding))
+        return clause, params
+
+    def matches(self, invoice):
+        """Whether a decoded invoice would appear in this filter's results"""
+        if self.start_date and not self.start_date <= invoice.date_generated <= self.end_date:
+            return False
+        if self.owner and invoice.owner != self.owner:
+            return False
+        if self.payment_method and invoice.payment_method != self.payment_method:
+            return False
+        if self.max_outstanding is not None and (
+                invoice.outstanding is None or invoice.outstanding > self.max_outstanding):
+            return False
+        return True
+
+
+class InvoiceStore:
+    """Invoice reads and writes with an LRU cache of filtered results
+
+    Writes made through the store, directly or in a unit of work,
+    invalidate only the cached results they affect. Commits from other
+    processes are picked up through PRAGMA data_version, which drops the
+    whole cache.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, archive=None, max_entries=32):
+        self.db_path = db_path
+        self.archive = archive or ArchiveManager(db_path)
+        self.max_entries = max_entries
+        self._conn = None
+        self._data_version = None
+        self._entries = OrderedDict()  # InvoiceFilter -> tuple of Invoice
+        self._rows = {}  # id -> Invoice for every cached row
+        self._owners = None
+
+    @property
+    def connection(self):
+        if self._conn is None:
+            self._conn = open_connection(self.db_path, detect_types=DETECT_TYPES)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA foreign_keys = ON")
+        return self._conn
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+        self.clear()
+
+    def clear(self):
+        self._entries.clear()
+        self._rows.clear()
+        self._owners = None
+
+    def _sync(self):
+        """Drop cached results if another connection committed since the last check"""
+        version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            if self._data_version is not None:
+                logger.info("Invoice cache invalidated by external write")
+            self.clear()
+            self._data_version = version
+
+    def find(self, invoice_filter):
+        """Invoices matching the filter, served from cache when possible"""
+        self._sync()
+        cached = self._entries.get(invoice_filter)
+        if cached is not None:
+            self._entries.move_to_end(invoice_filter)
+            return cached
+        conn = self.connection
+        source = self.archive.invoice_source(conn, invoice_filter.start_date)
+        clause, params = invoice_filter.where()
+        invoices = tuple(Invoice.from_row(row) for row in
+                         conn.execute(f"SELECT {_FIELD_LIST} FROM {source}{clause}", params))
+        self._entries[invoice_filter] = invoices
+        for invoice in invoices:
+            self._rows[invoice.id] = invoice
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._rows = {inv.id: inv for entry in self._entries.values() for inv in entry}
+        return invoices
+
+    def count_live(self, invoice_filter):
+        """Count of live invoices matching the filter, the rows update_where changes"""
+        clause, params = invoice_filter.where()
+        return self.connection.execute(f"SELECT COUNT(*) FROM main.Invoices{clause}",
+                                       params).fetchone()[0]
+
+    def get(self, invoice_id):
+        """Single invoice, without SQL when it is part of a cached result"""
+        self._sync()
+        invoice = self._rows.get(invoice_id)
+        if invoice is None:
+            conn = self.connection
+            row = conn.execute(f"SELECT {_FIELD_LIST} FROM {self.archive.invoice_source(conn)} "
+                               "WHERE id = ?", (invoice_id,)).fetchone()
+            invoice = Invoice.from_row(row) if row else None
+        return invoice
+
+    def owners(self):
+        self._sync()
+        if self._owners is None:
+            self._owners = [row[0] for row in
+                            self.connection.execute("SELECT DISTINCT owner FROM Invoices")]
+        return self._owners
+
+    def invalidate(self, *invoices):
+        """Drop cached results that contained, or would now contain, these invoices"""
+        invoices = [inv for inv in invoices if inv is not None]
+        ids = {inv.id for inv in invoices}
+        stale = [key for key, entry in self._entries.items()
+                 if any(key.matches(inv) for inv in invoices)
+                 or any(inv.id in ids for inv in entry)]
+        for key in stale:
+            del self._entries[key]
+        for invoice_id in ids:
+            self._rows.pop(invoice_id, None)
+        if stale:
+            self._rows = {inv.id: inv for entry in self._entries.values() for inv in entry}
+        self._owners = None
+
+    def unit_of_work(self, strict=False):
+        """Batch several writes into one transaction; see UnitOfWork"""
+        return UnitOfWork(self, strict)
+
+    def create(self, values):
+        """Insert an invoice from decoded values and return it"""
+        with self.unit_of_work(strict=True) as uow:
+            return uow.add(values)
+
+    def update(self, invoice_id, values):
+        with self.unit_of_work(strict=True) as uow:
+            return uow.update(invoice_id, values)
+
+    def delete(self, invoice_id):
+        with self.unit_of_work(strict=True) as uow:
+            uow.delete(invoice_id)
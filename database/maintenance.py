@@ -0,0 +1,214 @@
+import sqlite3
+import time
+from collections import namedtuple
+from .change_journal import ChangeJournal
+from .db_handler import DEFAULT_DB_PATH, open_connection
+from .logger import logger
+from .migrations import AUTO_VACUUM_INCREMENTAL
+
+
+class FileStats(namedtuple('FileStats', 'page_size page_count freelist_count unused_bytes')):
+    """Space usage of a database file; unused_bytes is None unless measured with dbstat"""
+    __slots__ = ()
+
+    @property
+    def file_bytes(self):
+        return self.page_size * self.page_count
+
+    @property
+    def freelist_ratio(self):
+        return self.freelist_count / self.page_count if self.page_count else 0.0
+
+    @property
+    def fragmentation(self):
+        """Share of the file that is free pages or unused space inside pages"""
+        if not self.page_count:
+            return 0.0
+        free_bytes = self.freelist_count * self.page_size + (self.unused_bytes or 0)
+        return free_bytes / self.file_bytes
+
+    def __str__(self):
+        return (f"{self.file_bytes / 1024:.0f} KiB, {self.freelist_count}/{self.page_count} "
+                f"free pages, {self.fragmentation:.1%} fragmented")
+
+
+def file_stats(conn, schema='main', detailed=False):
+    """Page counts from the pragmas; ``detailed`` also sums unused bytes with dbstat,
+    which reads every page of the file"""
+    page_size = conn.execute(f"PRAGMA {schema}.page_size").fetchone()[0]
+    page_count = conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+    freelist_count = conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+    unused = None
+    if detailed:
+        try:
+            unused = conn.execute("SELECT SUM(unused) FROM dbstat WHERE schema = ?",
+                                  (schema,)).fetchone()[0]
+        except sqlite3.OperationalError:  # SQLite built without SQLITE_ENABLE_DBSTAT_VTAB
+            pass
+    return FileStats(page_size, page_count, freelist_count, unused)
+
+
+class MaintenanceScheduler:
+    """Keep the database compact and its planner statistics fresh while the app is idle
+
+    A maintenance pass runs ANALYZE (bounded by ``analysis_limit``), ``PRAGMA
+    optimize``, change journal compaction and ``PRAGMA incremental_vacuum`` in
+    slices of ``pages_per_slice`` pages, never spending more than ``slice_ms``
+    before handing control back.
+    ``schedule(delay_ms, callback)`` works like Tk's ``root.after``; call
+    ``touch`` on user activity so passes only start after ``idle_ms`` of quiet.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, schedule=None, idle_ms=30000, slice_ms=50,
+                 interval_ms=3600000, pages_per_slice=256, vacuum_threshold=0.05,
+                 analysis_limit=1000):
+        self.db_path = db_path
+        self.schedule = schedule
+        self.idle_ms = idle_ms
+        self.slice_ms = slice_ms
+        self.interval_ms = interval_ms
+        self.pages_per_slice = pages_per_slice
+        self.vacuum_threshold = vacuum_threshold
+        self.analysis_limit = analysis_limit
+        self.last_stats = None
+        self._last_activity = time.monotonic()
+        self._pass = None
+        self._running = False
+
+    def start(self):
+        if self.schedule and not self._running:
+            self._running = True
+            self.schedule(self.idle_ms, self._tick)
+
+    def stop(self):
+        self._running = False
+        self._close_pass()
+
+    def touch(self, *_):
+        """Record user activity; an unfinished pass resumes after the next idle period"""
+        self._last_activity = time.monotonic()
+
+    def idle_for_ms(self):
+        return (time.monotonic() - self._last_activity) * 1000
+
+    def _tick(self):
+        if not self._running:
+            return
+        remaining = self.idle_ms - self.idle_for_ms()
+        if remaining > 0:
+            self.schedule(int(remaining) + 1, self._tick)
+            return
+        more = self.run_slice()
+        self.schedule(1 if more else self.interval_ms, self._tick)
+
+    def run_slice(self, budget_ms=None):
+        """Advance the current pass for at most budget_ms; returns True while work remains"""
+        budget = (self.slice_ms if budget_ms is None else budget_ms) / 1000
+        started = time.perf_counter()
+        if self._pass is None:
+            self._pass = self._maintenance_pass()
+        try:
+            while time.perf_counter() - started < budget:
+                next(self._pass)
+        except StopIteration:
+            self._pass = None
+            return False
+        except sqlite3.OperationalError as e:
+            # Usually "database is locked" by a concurrent write; retry on the next pass
+            logger.error(f"Maintenance interrupted: {str(e)}")
+            self._close_pass()
+            return False
+        return True
+
+    def run(self):
+        """Run a whole pass now, e.g. from the command line"""
+        while self.run_slice(budget_ms=float('inf')):
+            pass
+        return self.last_stats
+
+    def _close_pass(self):
+        if self._pass is not None:
+            self._pass.close()
+            self._pass = None
+
+    def _maintenance_pass(self):
+        """Generator doing one bounded unit of work per step"""
+        conn = open_connection(self.db_path, isolation_level=None, timeout=0.1)
+        try:
+            started = time.perf_counter()
+            before = file_stats(conn)
+            logger.info(f"Maintenance started: {before}")
+            yield
+
+            conn.execute(f"PRAGMA analysis_limit = {int(self.analysis_limit)}")
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+                step = time.perf_counter()
+                conn.execute("ANALYZE")
+                logger.info(f"ANALYZE took {(time.perf_counter() - step) * 1000:.1f} ms")
+                yield
+            step = time.perf_counter()
+            conn.execute("PRAGMA optimize")
+            logger.info(f"PRAGMA optimize took {(time.perf_counter() - step) * 1000:.1f} ms")
+            yield
+
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'ChangeCursors'").fetchone():
+                journal = ChangeJournal(self.db_path)
+                try:
+                    journal.compact()
+                finally:
+                    journal.close()
+                yield
+
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+                logger.warning("auto_vacuum is not INCREMENTAL, run database/init_db.py "
+                               "to migrate; free pages cannot be reclaimed")
+            elif (conn.execute("PRAGMA freelist_count").fetchone()[0]
+                  >= self.vacuum_threshold * conn.execute("PRAGMA page_count").fetchone()[0]):
+                step = time.perf_counter()
+                initial = free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                while free:
+                    # incremental_vacuum frees one page per step of the statement, so
+                    # executescript runs it to completion
+                    conn.executescript(f"PRAGMA incremental_vacuum({self.pages_per_slice});")
+                    remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                    if remaining >= free:
+                        break
+                    free = remaining
+                    yield
+                freed = initial - free
+                logger.info(f"Incremental vacuum freed {freed} pages in "
+                            f"{(time.perf_counter() - step) * 1000:.1f} ms")
+
+            self.last_stats = after = file_stats(conn)
+            logger.info(f"Maintenance finished in {(time.perf_counter() - started) * 1000:.1f} ms: "
+                        f"{after} (was {before})")
+        finally:
+            conn.close()
+
+    def vacuum(self):
+        """Full VACUUM to defragment pages; blocks other writers, so never run while idle"""
+        conn = open_connection(self.db_path, isolation_level=None)
+        try:
+            before = file_stats(conn, detailed=True)
+            started = time.perf_counter()
+            conn.execute("VACUUM")
+            self.last_stats = after = file_stats(conn, detailed=True)
+            logger.info(f"VACUUM took {(time.perf_counter() - started) * 1000:.1f} ms: "
+                        f"{after} (was {before})")
+            return after
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run database maintenance now")
+    parser.add_argument('--full', action='store_true', help="also run a full VACUUM")
+    args = parser.parse_args()
+
+    scheduler = MaintenanceScheduler()
+    stats = scheduler.run()
+    if args.full:
+        stats = scheduler.vacuum()
+    print(stats)
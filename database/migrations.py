@@ -0,0 +1,453 @@
+import hashlib
+import os
+import sqlite3
+from datetime import datetime
+from .db_handler import (DEFAULT_DB_PATH, INVOICE_COLUMNS, archive_path_for, open_connection,
+                         transaction)
+from .logger import logger
+
+# Invoices layout with integer cents and day numbers (days since 1970-01-01).
+# AUTOINCREMENT keeps ids unique across the live and archive tables.
+INVOICES_TABLE = '''CREATE TABLE {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date_generated EPOCHDAY INTEGER NOT NULL,
+    invoice_number TEXT UNIQUE,
+    owner TEXT,
+    full_amount_pending CENTS INTEGER,
+    payment_collected CENTS INTEGER,
+    date_of_payment EPOCHDAY INTEGER,
+    date_of_last_payment EPOCHDAY INTEGER,
+    payment_method TEXT,
+    outstanding CENTS INTEGER GENERATED ALWAYS AS (full_amount_pending - COALESCE(payment_collected, 0)) VIRTUAL,
+    CHECK (payment_collected BETWEEN 0 AND full_amount_pending)
+)'''
+
+SETTINGS_TABLE = '''CREATE TABLE IF NOT EXISTS Settings (
+    id INTEGER PRIMARY KEY,
+    currency TEXT DEFAULT 'USD',
+    date_format TEXT DEFAULT 'YYYY-MM-DD',
+    payment_methods TEXT DEFAULT 'Cash,Card,Bank Transfer,Utab,Cheque,Stripe,Tabby,Tamara'
+)'''
+
+SCHEMA_INFO_TABLE = '''CREATE TABLE IF NOT EXISTS SchemaInfo (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    fingerprint TEXT NOT NULL,
+    catalog_hash TEXT NOT NULL,
+    migrated_at TEXT NOT NULL
+)'''
+
+# Triggers from the old schema.sql; they write to the generated outstanding column
+LEGACY_TRIGGERS = ('update_outstanding_insert', 'update_outstanding_update',
+                   'update_last_payment_date')
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+TODAY = "CAST(strftime('%s', 'now') AS INTEGER) / 86400"
+
+INVOICES_INDEXES = (
+    '''CREATE INDEX IF NOT EXISTS {schema}.idx_invoices_date_generated
+        ON Invoices (date_generated)''',
+)
+
+INVOICES_TRIGGERS = (
+    f'''CREATE TRIGGER IF NOT EXISTS {{schema}}.update_payment_dates
+        AFTER UPDATE OF payment_collected ON Invoices
+        WHEN NEW.payment_collected > 0
+        BEGIN
+            UPDATE Invoices SET
+                date_of_payment = COALESCE(NEW.date_of_payment, {TODAY}),
+                date_of_last_payment = CASE
+                    WHEN NEW.payment_collected >= NEW.full_amount_pending THEN {TODAY}
+                    ELSE COALESCE(date_of_last_payment, {TODAY})
+                END
+            WHERE id = NEW.id;
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS {schema}.validate_payment_amount
+        BEFORE UPDATE OF payment_collected ON Invoices
+        BEGIN
+            SELECT CASE
+                WHEN NEW.payment_collected < 0 THEN
+                    RAISE (ABORT, 'Payment amount cannot be negative')
+                WHEN NEW.payment_collected > OLD.full_amount_pending THEN
+                    RAISE (ABORT, 'Payment exceeds pending amount')
+            END;
+        END''',
+)
+
+# Rejects values that were not encoded with to_cents / to_day before writing
+_TYPE_CHECKS = '''SELECT CASE
+                WHEN typeof(NEW.full_amount_pending) NOT IN ('integer', 'null') THEN
+                    RAISE (ABORT, 'Full amount must be numeric (integer cents)')
+                WHEN typeof(NEW.payment_collected) NOT IN ('integer', 'null') THEN
+                    RAISE (ABORT, 'Payment collected must be numeric (integer cents)')
+                WHEN typeof(NEW.date_generated) != 'integer'
+                    OR typeof(NEW.date_of_payment) NOT IN ('integer', 'null')
+                    OR typeof(NEW.date_of_last_payment) NOT IN ('integer', 'null') THEN
+                    RAISE (ABORT, 'Invalid isoformat date (expected a day number)')
+            END;'''
+
+VALIDATION_TRIGGERS = (
+    f'''CREATE TRIGGER IF NOT EXISTS {{schema}}.validate_invoice_insert
+        BEFORE INSERT ON Invoices
+        BEGIN
+            {_TYPE_CHECKS}
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {{schema}}.validate_invoice_update
+        BEFORE UPDATE ON Invoices
+        BEGIN
+            {_TYPE_CHECKS}
+        END''',
+)
+
+# Change-data-capture log: one row per written invoice, in commit order.
+# AUTOINCREMENT keeps sequence numbers increasing even after compaction.
+CHANGE_JOURNAL_TABLES = (
+    '''CREATE TABLE IF NOT EXISTS {schema}.InvoiceChanges (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        invoice_id INTEGER NOT NULL,
+        op TEXT NOT NULL CHECK (op IN ('I', 'U', 'D', 'A')),
+        changed_at TEXT NOT NULL DEFAULT (datetime('now'))
+    )''',
+    '''CREATE TABLE IF NOT EXISTS {schema}.ChangeCursors (
+        consumer TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+    )''',
+)
+
+CHANGE_JOURNAL_TRIGGERS = (
+    '''CREATE TRIGGER IF NOT EXISTS {schema}.journal_invoice_insert
+        AFTER INSERT ON Invoices
+        BEGIN
+            INSERT INTO InvoiceChanges (invoice_id, op) VALUES (NEW.id, 'I');
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS {schema}.journal_invoice_update
+        AFTER UPDATE ON Invoices
+        BEGIN
+            INSERT INTO InvoiceChanges (invoice_id, op) SELECT OLD.id, 'D' WHERE OLD.id != NEW.id;
+            INSERT INTO InvoiceChanges (invoice_id, op) VALUES (NEW.id, 'U');
+        END''',
+    '''CREATE TRIGGER IF NOT EXISTS {schema}.journal_invoice_delete
+        AFTER DELETE ON Invoices
+        BEGIN
+            INSERT INTO InvoiceChanges (invoice_id, op) VALUES (OLD.id, 'D');
+        END''',
+)
+
+# Pre-migration-2 layout with REAL amounts and TEXT dates, upgraded by upgrade_invoice_storage
+LEGACY_INVOICES_TABLE = '''CREATE TABLE {table} (
+    id INTEGER PRIMARY KEY,
+    date_generated TEXT NOT NULL,
+    invoice_number TEXT UNIQUE,
+    owner TEXT,
+    full_amount_pending REAL,
+    payment_collected REAL,
+    date_of_payment TEXT,
+    date_of_last_payment TEXT,
+    payment_method TEXT,
+    outstanding REAL GENERATED ALWAYS AS (full_amount_pending - COALESCE(payment_collected, 0)) VIRTUAL
+)'''
+
+REAL_TO_CENTS = "CAST(ROUND({0} * 100) AS INTEGER)"
+TEXT_TO_DAY = "CAST(julianday({0}) - 2440587.5 AS INTEGER)"
+LEGACY_INVOICE_EXPRESSIONS = {
+    'full_amount_pending': REAL_TO_CENTS, 'payment_collected': REAL_TO_CENTS,
+    'date_generated': TEXT_TO_DAY, 'date_of_payment': TEXT_TO_DAY, 'date_of_last_payment': TEXT_TO_DAY,
+}
+
+
+def table_columns(conn, table, schema='main'):
+    """Map column name to declared type, including generated columns"""
+    return {row[1]: row[2].upper() for row in
+            conn.execute(f"PRAGMA {schema}.table_xinfo({table})")}
+
+
+def rebuild_table(conn, table, create_sql, columns, expressions=None, schema='main',
+                  batch_size=1000, progress=None):
+    """Online copy-and-swap rebuild of a table keyed on an integer id
+
+    Rows are copied into a shadow table one batch per transaction, so other
+    connections keep reading and writing the old table. Writes made during
+    the copy are recorded by change-tracking triggers and replayed during
+    the short final swap transaction.
+    """
+    expressions = expressions or {}
+    shadow = f"{table}_rebuild"
+    dirty = f"{table}_rebuild_dirty"
+    target_list = ', '.join(columns)
+    select_list = ', '.join(expressions.get(c, '{0}').format(c) for c in columns)
+
+    conn.execute(f"DROP TABLE IF EXISTS {schema}.{shadow}")
+    conn.execute(create_sql.format(table=f"{schema}.{shadow}"))
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {schema}.{dirty} (row_id INTEGER PRIMARY KEY)")
+    for event, ref in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {schema}.{table}_rebuild_{event.lower()}
+            AFTER {event} ON {table}
+            BEGIN
+                INSERT OR IGNORE INTO {dirty} (row_id) VALUES ({ref}.id);
+            END''')
+
+    total = conn.execute(f"SELECT COUNT(*) FROM {schema}.{table}").fetchone()[0]
+    copied, last_id = 0, None
+    while True:
+        with transaction(conn):
+            rows = conn.execute(
+                f'''SELECT id FROM {schema}.{table} WHERE id > ?
+                    ORDER BY id LIMIT ?''', (-2**63 if last_id is None else last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            first, last = rows[0][0], rows[-1][0]
+            conn.execute(
+                f'''INSERT INTO {schema}.{shadow} ({target_list})
+                    SELECT {select_list} FROM {schema}.{table}
+                    WHERE id BETWEEN ? AND ?''', (first, last))
+        copied += len(rows)
+        last_id = last
+        if progress:
+            progress(table, copied, total)
+
+    with transaction(conn):
+        conn.execute(f'''DELETE FROM {schema}.{shadow}
+            WHERE id IN (SELECT row_id FROM {schema}.{dirty})''')
+        conn.execute(f'''INSERT INTO {schema}.{shadow} ({target_list})
+            SELECT {select_list} FROM {schema}.{table}
+            WHERE id IN (SELECT row_id FROM {schema}.{dirty})''')
+        conn.execute(f"DROP TABLE {schema}.{table}")
+        conn.execute(f"DROP TABLE {schema}.{dirty}")
+        conn.execute(f"ALTER TABLE {schema}.{shadow} RENAME TO {table}")
+    logger.info(f"Rebuilt {schema}.{table} ({copied} rows)")
+    return copied
+
+
+def upgrade_invoice_storage(conn, schema='main', batch_size=1000, progress=None):
+    """Convert a REAL/TEXT Invoices table to integer cents and day numbers
+
+    Safe to call repeatedly; returns False when the table is already converted.
+    """
+    columns = table_columns(conn, 'Invoices', schema)
+    if not columns or columns.get('full_amount_pending', '').startswith('CENTS'):
+        return False
+    rebuild_table(conn, 'Invoices', INVOICES_TABLE, INVOICE_COLUMNS,
+                  LEGACY_INVOICE_EXPRESSIONS, schema, batch_size, progress)
+    with transaction(conn):
+        for statement in INVOICES_INDEXES + INVOICES_TRIGGERS:
+            conn.execute(statement.format(schema=schema))
+    return True
+
+
+def reserve_invoice_ids(conn, high_water, schema='main'):
+    """Make sure new invoices get ids above high_water, e.g. the archive's max id"""
+    if not high_water or not conn.execute(
+            f"SELECT 1 FROM {schema}.sqlite_master WHERE name = 'sqlite_sequence'").fetchone():
+        return
+    updated = conn.execute(f"UPDATE {schema}.sqlite_sequence SET seq = MAX(seq, ?) "
+                           "WHERE name = 'Invoices'", (high_water,)).rowcount
+    if not updated:
+        conn.execute(f"INSERT INTO {schema}.sqlite_sequence (name, seq) VALUES ('Invoices', ?)",
+                     (high_water,))
+
+
+def _attach_archive(conn):
+    """Attach the archive file next to the main database as ``archive``; False if there is none"""
+    main_file = next((row[2] for row in conn.execute("PRAGMA database_list") if row[1] == 'main'), '')
+    path = archive_path_for(main_file) if main_file else None
+    if not path or not os.path.exists(path):
+        return False
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    if conn.execute("SELECT 1 FROM archive.sqlite_master WHERE name = 'Invoices'").fetchone():
+        return True
+    conn.execute("DETACH DATABASE archive")
+    return False
+
+
+class Migration:
+    """One schema step; online migrations manage their own transactions"""
+
+    def __init__(self, version, name, apply, online=False):
+        self.version = version
+        self.name = name
+        self.apply = apply
+        self.online = online
+
+
+MIGRATIONS = []
+
+
+def migration(version, name, online=False):
+    def register(apply):
+        MIGRATIONS.append(Migration(version, name, apply, online))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return apply
+    return register
+
+
+@migration(1, 'create invoices and settings')
+def _create_base_tables(conn, progress):
+    conn.execute(INVOICES_TABLE.replace('CREATE TABLE', 'CREATE TABLE IF NOT EXISTS', 1)
+                 .format(table='main.Invoices'))
+    conn.execute(SETTINGS_TABLE)
+    conn.execute("INSERT INTO Settings (id) SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM Settings)")
+
+
+@migration(2, 'integer money and dates', online=True)
+def _integer_storage(conn, progress):
+    upgrade_invoice_storage(conn, progress=progress)
+    with transaction(conn):
+        for trigger in LEGACY_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        for statement in INVOICES_INDEXES + INVOICES_TRIGGERS:
+            conn.execute(statement.format(schema='main'))
+
+
+@migration(3, 'reject unencoded money and dates')
+def _validation_triggers(conn, progress):
+    for statement in VALIDATION_TRIGGERS:
+        conn.execute(statement.format(schema='main'))
+
+
+@migration(4, 'incremental auto-vacuum', online=True)
+def _incremental_auto_vacuum(conn, progress):
+    # Changing auto_vacuum on an existing file only takes effect after a VACUUM,
+    # which cannot run inside a transaction
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+@migration(5, 'invoice change journal')
+def _change_journal(conn, progress):
+    for statement in CHANGE_JOURNAL_TABLES + CHANGE_JOURNAL_TRIGGERS:
+        conn.execute(statement.format(schema='main'))
+
+
+@migration(6, 'monotonic invoice ids', online=True)
+def _monotonic_invoice_ids(conn, progress):
+    # Without AUTOINCREMENT SQLite hands the ids of archived invoices out again
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'Invoices'").fetchone()[0]
+    if 'AUTOINCREMENT' not in sql.upper():
+        rebuild_table(conn, 'Invoices', INVOICES_TABLE, INVOICE_COLUMNS, progress=progress)
+    # ATTACH cannot run inside a transaction
+    archived = _attach_archive(conn)
+    try:
+        with transaction(conn):
+            for statement in (INVOICES_INDEXES + INVOICES_TRIGGERS + VALIDATION_TRIGGERS
+                              + CHANGE_JOURNAL_TRIGGERS):
+                conn.execute(statement.format(schema='main'))
+            # Live invoices that already reused an archived id move to fresh ids
+            next_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM main.Invoices").fetchone()[0]
+            clashes = []
+            if archived:
+                next_id = max(next_id, conn.execute(
+                    "SELECT COALESCE(MAX(id), 0) FROM archive.Invoices").fetchone()[0])
+                clashes = [row[0] for row in conn.execute(
+                    '''SELECT id FROM main.Invoices
+                       WHERE id IN (SELECT id FROM archive.Invoices) ORDER BY id''')]
+            for old_id in clashes:
+                next_id += 1
+                conn.execute("UPDATE main.Invoices SET id = ? WHERE id = ?", (next_id, old_id))
+            reserve_invoice_ids(conn, next_id)
+    finally:
+        if archived:
+            conn.execute("DETACH DATABASE archive")
+    if clashes:
+        logger.warning(f"Renumbered {len(clashes)} invoices whose ids were also in the archive: "
+                       f"{', '.join(map(str, clashes))}")
+
+
+LATEST_VERSION = MIGRATIONS[-1].version
+# Identifies the schema this code expects; stored alongside user_version
+SCHEMA_FINGERPRINT = hashlib.sha1('\n'.join(
+    [f"{m.version}:{m.name}" for m in MIGRATIONS]
+    + [INVOICES_TABLE, SETTINGS_TABLE, *INVOICES_INDEXES, *INVOICES_TRIGGERS, *VALIDATION_TRIGGERS,
+       *CHANGE_JOURNAL_TABLES, *CHANGE_JOURNAL_TRIGGERS]
+).encode()).hexdigest()
+
+
+def catalog_hash(conn):
+    """Hash of the DDL actually stored in sqlite_master
+
+    SQLite's own tables (sqlite_sequence, sqlite_stat1 from ANALYZE) are ignored.
+    """
+    rows = conn.execute('''SELECT type, name, sql FROM sqlite_master
+        WHERE sql IS NOT NULL AND name != 'SchemaInfo' AND name NOT LIKE 'sqlite!_%' ESCAPE '!'
+        ORDER BY type, name''').fetchall()
+    return hashlib.sha1('\n'.join(f"{t}|{n}|{' '.join(sql.split())}"
+                                   for t, n, sql in rows).encode()).hexdigest()
+
+
+def migrate(conn, progress=None):
+    """Apply pending migrations in order, recording each in PRAGMA user_version
+
+    Returns the number of migrations applied. Each step is idempotent, so a
+    migration interrupted half way is simply re-run on the next start.
+    Raises RuntimeError when the DDL in this module changed since the
+    database was migrated but no migration was added for it.
+    """
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    pending = [m for m in MIGRATIONS if m.version > current]
+    for step in pending:
+        logger.info(f"Applying migration {step.version}: {step.name}")
+        if step.online:
+            step.apply(conn, progress)
+            with transaction(conn):
+                conn.execute(f"PRAGMA user_version = {step.version}")
+        else:
+            with transaction(conn):
+                step.apply(conn, progress)
+                conn.execute(f"PRAGMA user_version = {step.version}")
+        if progress:
+            progress(f"migration {step.version}", step.version, LATEST_VERSION)
+    stored = None if pending else _stored_fingerprint(conn)
+    if stored is not None and stored != SCHEMA_FINGERPRINT:
+        # CREATE ... IF NOT EXISTS never reapplies changed DDL, so relabelling would hide it
+        raise RuntimeError(f"Schema definitions changed without a new migration (database is at "
+                           f"version {current}); add a numbered migration that applies them")
+    if pending or stored is None:
+        with transaction(conn):
+            conn.execute(SCHEMA_INFO_TABLE)
+            conn.execute('''INSERT OR REPLACE INTO SchemaInfo
+                (id, fingerprint, catalog_hash, migrated_at) VALUES (1, ?, ?, ?)''',
+                (SCHEMA_FINGERPRINT, catalog_hash(conn), datetime.now().isoformat()))
+    return len(pending)
+
+
+def _stored_fingerprint(conn):
+    try:
+        row = conn.execute("SELECT fingerprint FROM SchemaInfo WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def validate_db_schema(conn: sqlite3.Connection):
+    """Fast startup check: user_version and stored fingerprint match this code"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version != LATEST_VERSION:
+        raise RuntimeError(f"Schema version {version}, expected {LATEST_VERSION}")
+    if _stored_fingerprint(conn) != SCHEMA_FINGERPRINT:
+        raise RuntimeError("Schema fingerprint mismatch, run database/init_db.py")
+
+
+def verify_schema(conn: sqlite3.Connection):
+    """Full check that the catalog has not drifted since the last migration"""
+    validate_db_schema(conn)
+    stored = conn.execute("SELECT catalog_hash FROM SchemaInfo WHERE id = 1").fetchone()[0]
+    if stored != catalog_hash(conn):
+        raise RuntimeError("Database schema was modified outside of migrations")
+
+
+def migrate_database(db_path=DEFAULT_DB_PATH, progress=None):
+    conn = open_connection(db_path)
+    try:
+        return migrate(conn, progress)
+    except sqlite3.Error as e:
+        logger.error(f"Migration failed: {str(e)}")
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    migrate_database(progress=lambda step, done, total: print(f"{step}: {done}/{total}"))
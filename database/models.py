@@ -0,0 +1,23 @@
+from .db_handler import INVOICE_COLUMNS
+
+INVOICE_FIELDS = INVOICE_COLUMNS + ('outstanding',)
+TREE_FIELDS = ('id', 'date_generated', 'invoice_number', 'owner', 'outstanding')
+
+
+class Invoice:
+    """Compact, decoded invoice row (Decimal amounts, ISO dates)"""
+    __slots__ = INVOICE_FIELDS
+
+    def __init__(self, *values):
+        for field, value in zip(INVOICE_FIELDS, values):
+            setattr(self, field, value)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*(row[field] for field in INVOICE_FIELDS))
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in INVOICE_FIELDS}
+
+    def __repr__(self):
+        return f"Invoice(id={self.id}, number={self.invoice_number!r}, outstanding={self.outstanding})"
@@ -0,0 +1,160 @@
+import re
+import sqlite3
+from collections import namedtuple
+from functools import lru_cache
+from operator import attrgetter
+from .db_handler import DATE_COLUMNS, DEFAULT_DB_PATH, MONEY_COLUMNS, open_connection
+from .logger import logger
+from .models import TREE_FIELDS
+
+_DATE_TOKEN = re.compile(r'YYYY|YY|MM|DD')
+# Where each token sits in an ISO date string (YYYY-MM-DD)
+_ISO_SLICES = {'YYYY': '{0[0]}{0[1]}{0[2]}{0[3]}', 'YY': '{0[2]}{0[3]}',
+               'MM': '{0[5]}{0[6]}', 'DD': '{0[8]}{0[9]}'}
+
+
+@lru_cache(maxsize=None)
+def date_formatter(date_format):
+    """Compile a format like 'DD/MM/YYYY' into a function of an ISO date string
+
+    The pattern is translated once into a str.format template that indexes
+    the ISO string, so formatting a cell never parses a date.
+    """
+    if not _DATE_TOKEN.search(date_format):
+        raise ValueError(f"Date format needs YYYY, YY, MM or DD: {date_format!r}")
+    if date_format == 'YYYY-MM-DD':
+        return lambda value: value or ''
+    template = _DATE_TOKEN.sub(lambda m: _ISO_SLICES[m.group()],
+                               date_format.replace('{', '{{').replace('}', '}}'))
+    render = template.format
+    return lambda value: render(value) if value else ''
+
+
+@lru_cache(maxsize=None)
+def money_formatter(currency):
+    """Compile a function of a Decimal amount, e.g. 'USD 1,234.50'"""
+    render = (currency.replace('{', '{{').replace('}', '}}') + ' {:,.2f}').format
+    return lambda value: '' if value is None else render(value)
+
+
+def _plain(value):
+    return '' if value is None else value
+
+
+class AppSettings(namedtuple('AppSettings', 'currency date_format payment_methods')):
+    """Immutable snapshot of the Settings row; payment_methods is a tuple"""
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, currency, date_format, payment_methods):
+        """Normalize and validate raw values; raises ValueError"""
+        currency = (currency or '').strip().upper()
+        if not currency:
+            raise ValueError("Currency cannot be empty")
+        date_format = (date_format or '').strip()
+        date_formatter(date_format)
+        if isinstance(payment_methods, str):
+            payment_methods = payment_methods.split(',')
+        payment_methods = tuple(dict.fromkeys(m.strip() for m in payment_methods if m.strip()))
+        return cls(currency, date_format, payment_methods)
+
+    @property
+    def format_date(self):
+        return date_formatter(self.date_format)
+
+    @property
+    def format_money(self):
+        return money_formatter(self.currency)
+
+    def formatter_for(self, field):
+        if field in MONEY_COLUMNS:
+            return self.format_money
+        if field in DATE_COLUMNS:
+            return self.format_date
+        return _plain
+
+    def row_formatter(self, fields=TREE_FIELDS):
+        """Function turning an Invoice into a tuple of display strings for the given fields"""
+        formatters = tuple(self.formatter_for(field) for field in fields)
+        if len(fields) == 1:
+            value = attrgetter(fields[0])
+            return lambda invoice: (formatters[0](value(invoice)),)
+        values = attrgetter(*fields)
+        return lambda invoice: tuple(f(v) for f, v in zip(formatters, values(invoice)))
+
+
+class SettingsService:
+    """Loads the Settings row once and notifies subscribers when it changes
+
+    ``current`` is an AppSettings snapshot; it is replaced, never mutated.
+    ``refresh`` picks up changes committed by other processes through PRAGMA
+    data_version and costs a single pragma when nothing changed.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._conn = None
+        self._data_version = None
+        self._current = None
+        self._subscribers = []
+
+    @property
+    def connection(self):
+        if self._conn is None:
+            self._conn = open_connection(self.db_path)
+        return self._conn
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    @property
+    def current(self):
+        if self._current is None:
+            self._current = self._load()
+        return self._current
+
+    def _load(self):
+        conn = self.connection
+        self._data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        row = conn.execute(
+            "SELECT currency, date_format, payment_methods FROM Settings WHERE id = 1").fetchone()
+        if row is None:
+            raise sqlite3.DatabaseError("Settings row is missing, run database/init_db.py")
+        return AppSettings.build(*row)
+
+    def subscribe(self, callback, notify=True):
+        """Call callback(settings) now (unless notify is False) and after every change"""
+        self._subscribers.append(callback)
+        if notify:
+            callback(self.current)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def _publish(self, settings):
+        changed = settings != self._current
+        self._current = settings
+        if changed:
+            for callback in list(self._subscribers):
+                callback(settings)
+        return changed
+
+    def refresh(self):
+        """Reload if another connection committed since the last read; True if settings changed"""
+        version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if self._current is not None and version == self._data_version:
+            return False
+        return self._publish(self._load())
+
+    def update(self, **changes):
+        """Validate and save some settings, then notify subscribers; returns the new snapshot"""
+        settings = AppSettings.build(**{**self.current._asdict(), **changes})
+        with self.connection as conn:
+            conn.execute('''UPDATE Settings SET currency = ?, date_format = ?, payment_methods = ?
+                WHERE id = 1''', (settings.currency, settings.date_format,
+                                   ','.join(settings.payment_methods)))
+        logger.info(f"Settings updated: {', '.join(changes)}")
+        self._publish(settings)
+        return settings
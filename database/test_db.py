@@ -1,20 +1,20 @@
 import pytest
 from datetime import datetime
-from database.db_handler import get_db_connection, DatabaseError
+from database.db_handler import get_db_connection, DatabaseError, to_cents, to_day
 
-def test_valid_invoice_workflow():
-    with get_db_connection() as conn:
+def test_valid_invoice_workflow(db_path):
+    with get_db_connection(db_path) as conn:
         cursor = conn.cursor()
         # Test valid workflow
         # Cleanup any existing test data
         cursor.execute("DELETE FROM Invoices WHERE invoice_number LIKE 'INV-%'")
             
         valid_data = {
-            'date_generated': datetime.now().isoformat(),
+            'date_generated': to_day(datetime.now()),
             'invoice_number': 'INV-001',
             'owner': 'John Doe',
-            'full_amount_pending': 1000.0,
-            'payment_collected': 0.0
+            'full_amount_pending': to_cents(1000.0),
+            'payment_collected': to_cents(0.0)
         }
         
         # Test insert
@@ -28,9 +28,9 @@ def test_valid_invoice_workflow():
         # Test update
         cursor.execute('''
             UPDATE Invoices 
-            SET payment_collected = 500.0 
+            SET payment_collected = ? 
             WHERE invoice_number = 'INV-001'
-        ''')
+        ''', (to_cents(500.0),))
         
         # Verify calculations
         cursor.execute('''
@@ -42,32 +42,34 @@ def test_valid_invoice_workflow():
         assert result['outstanding'] == 500.0
         assert result['date_of_last_payment'] is not None
 
-def test_invalid_scenarios():
-    with get_db_connection() as conn:
+def test_invalid_scenarios(db_path):
+    with get_db_connection(db_path) as conn:
         cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO Invoices (invoice_number, date_generated, full_amount_pending)
+            VALUES (?, ?, ?)
+        ''', ('INV-001', to_day(datetime.now()), to_cents(1000.0)))
         
         # Test duplicate invoice number
         with pytest.raises(DatabaseError, match=r"UNIQUE constraint failed: Invoices.invoice_number"):
             cursor.execute('''
                 INSERT INTO Invoices (invoice_number, date_generated, full_amount_pending)
                 VALUES (?, ?, ?)
-            ''', ('INV-001', datetime.now().isoformat(), 1000.0))
+            ''', ('INV-001', to_day(datetime.now()), to_cents(1000.0)))
             
         # Test invalid amount type
         with pytest.raises(DatabaseError, match="Full amount must be numeric"):
             cursor.execute('''
                 INSERT INTO Invoices (invoice_number, date_generated, full_amount_pending)
-                VALUES ('INV-002', datetime('now'), 'one thousand')
-            ''')
+                VALUES ('INV-002', ?, 'one thousand')
+            ''', (to_day(datetime.now()),))
             
         # Test invalid date format
         with pytest.raises(DatabaseError, match="Invalid isoformat"):
             cursor.execute('''
                 INSERT INTO Invoices (invoice_number, date_generated, full_amount_pending)
-                VALUES ('INV-003', '2023-13-32', 1000.0)
+                VALUES ('INV-003', '2023-13-32', 100000)
             ''')
 
 if __name__ == "__main__":
-    test_valid_invoice_workflow()
-    test_invalid_scenarios()
-    print("All tests passed successfully")
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,213 @@
+import sqlite3
+from .db_handler import encode_invoice, transaction
+from .logger import logger
+from .models import INVOICE_FIELDS, Invoice
+
+_FIELD_LIST = ', '.join(INVOICE_FIELDS)
+
+
+class BatchResult:
+    """Outcome of a unit of work: applied changes and per-operation errors"""
+
+    def __init__(self):
+        self.applied = []  # descriptions of successful operations
+        self.errors = []  # (index, description, message)
+        self.commit_error = None  # set when the batch as a whole was not saved
+
+    @property
+    def ok(self):
+        return not self.errors and self.commit_error is None
+
+    def summary(self):
+        if self.commit_error is not None:
+            return (f"{len(self.applied) + len(self.errors)} changes not saved "
+                    f"({self.commit_error})")
+        if self.errors:
+            index, description, message = self.errors[0]
+            total = len(self.applied) + len(self.errors)
+            return f"{len(self.errors)} of {total} changes failed ({description}: {message})"
+        if len(self.applied) == 1:
+            return self.applied[0]
+        return f"{len(self.applied)} changes saved"
+
+
+class WriteError(Exception):
+    def __init__(self, result):
+        super().__init__(result.errors[0][2] if result.errors else "Write failed")
+        self.result = result
+
+
+class UnitOfWork:
+    """Batch invoice mutations into one transaction
+
+    Every operation runs in its own savepoint, so a failing one is rolled
+    back and reported in ``result`` while the rest of the batch commits.
+    With ``strict=True`` the first failure rolls back the whole unit and
+    raises WriteError.
+    """
+
+    def __init__(self, store, strict=False):
+        self.store = store
+        self.strict = strict
+        self.result = BatchResult()
+        self.conn = None
+        self._touched = []
+        self._index = 0
+
+    def __enter__(self):
+        self.conn = self.store.connection
+        self.store._sync()
+        self.conn.execute("SAVEPOINT unit_of_work")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.conn.execute("ROLLBACK TO unit_of_work")
+            self.conn.execute("RELEASE unit_of_work")
+            return False
+        try:
+            self.conn.execute("RELEASE unit_of_work")
+        except sqlite3.Error as e:
+            # e.g. "database is locked" while another connection reads; nothing was saved
+            logger.error(f"Commit failed: {str(e)}")
+            # Only releasing the outermost savepoint commits, so end the whole transaction
+            self.conn.execute("ROLLBACK")
+            self.result.commit_error = str(e)
+            if self.strict:
+                raise WriteError(self.result) from e
+            return False
+        # Our own commit does not bump data_version for this connection
+        self.store.invalidate(*self._touched)
+        return False
+
+    def _apply(self, description, operation):
+        index = self._index
+        self._index += 1
+        try:
+            with transaction(self.conn, 'unit_of_work_op'):
+                value = operation()
+        except (sqlite3.Error, ValueError, ArithmeticError) as e:
+            logger.error(f"Write failed ({description}): {str(e)}")
+            self.result.errors.append((index, description, str(e)))
+            if self.strict:
+                raise WriteError(self.result) from e
+            return None
+        self.result.applied.append(description)
+        return value
+
+    def _fetch(self, clause, params):
+        return [Invoice.from_row(row) for row in self.conn.execute(
+            f"SELECT {_FIELD_LIST} FROM main.Invoices{clause}", params)]
+
+    def _fetch_ids(self, ids):
+        invoices = []
+        ids = list(ids)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            invoices += self._fetch(f" WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+        return invoices
+
+    def add(self, values):
+        """Insert an invoice from decoded values; returns the stored Invoice"""
+        def insert():
+            encoded = encode_invoice(values)
+            columns = ', '.join(encoded)
+            marks = ', '.join('?' * len(encoded))
+            cursor = self.conn.execute(f"INSERT INTO Invoices ({columns}) VALUES ({marks})",
+                                       tuple(encoded.values()))
+            invoice = self._fetch(" WHERE id = ?", (cursor.lastrowid,))[0]
+            self._touched.append(invoice)
+            return invoice
+        return self._apply(f"Invoice {values.get('invoice_number')} created", insert)
+
+    def update(self, invoice_id, values):
+        def change():
+            old = self._fetch(" WHERE id = ?", (invoice_id,))
+            if not old:
+                raise ValueError(f"Invoice #{invoice_id} not found")
+            encoded = encode_invoice(values)
+            assignments = ', '.join(f"{column} = ?" for column in encoded)
+            self.conn.execute(f"UPDATE Invoices SET {assignments} WHERE id = ?",
+                              (*encoded.values(), invoice_id))
+            new = self._fetch(" WHERE id = ?", (invoice_id,))
+            self._touched += old + new
+            return new[0]
+        return self._apply(f"Invoice #{invoice_id} updated", change)
+
+    def delete(self, invoice_id):
+        def remove():
+            old = self._fetch(" WHERE id = ?", (invoice_id,))
+            if not old:
+                # Also the case for archived invoices, which are listed but read-only
+                raise ValueError(f"Invoice #{invoice_id} not found")
+            self.conn.execute("DELETE FROM Invoices WHERE id = ?", (invoice_id,))
+            self._touched += old
+            return len(old)
+        return self._apply(f"Invoice #{invoice_id} deleted", remove)
+
+    def update_where(self, invoice_filter, values):
+        """Apply the same change to every invoice matching the filter; returns the count"""
+        def change():
+            clause, params = invoice_filter.where()
+            old = self._fetch(clause, params)
+            encoded = encode_invoice(values)
+            assignments = ', '.join(f"{column} = ?" for column in encoded)
+            self.conn.execute(f"UPDATE Invoices SET {assignments}{clause}",
+                              (*encoded.values(), *params))
+            self._touched += old + self._fetch_ids(inv.id for inv in old)
+            return len(old)
+        return self._apply(f"Bulk update of {', '.join(values)}", change)
+
+    def delete_where(self, invoice_filter):
+        def remove():
+            clause, params = invoice_filter.where()
+            old = self._fetch(clause, params)
+            self.conn.execute(f"DELETE FROM Invoices{clause}", params)
+            self._touched += old
+            return len(old)
+        return self._apply("Bulk delete", remove)
+
+
+class GroupCommitter:
+    """Coalesce writes submitted within a few milliseconds into one commit
+
+    ``schedule(delay_ms, callback)`` arranges a later flush on the caller's
+    thread, e.g. Tk's ``root.after``. Without it, call ``flush`` explicitly.
+    ``on_batch`` receives the BatchResult of every flushed batch.
+    """
+
+    def __init__(self, store, window_ms=5, schedule=None, on_batch=None, max_batch=500):
+        self.store = store
+        self.window_ms = window_ms
+        self.schedule = schedule
+        self.on_batch = on_batch
+        self.max_batch = max_batch
+        self._pending = []
+        self._scheduled = False
+
+    def submit(self, operation, *args):
+        """Queue a UnitOfWork operation by name, e.g. submit('delete', 42)"""
+        self._pending.append((operation, args))
+        if len(self._pending) >= self.max_batch:
+            self.flush()
+        elif self.schedule and not self._scheduled:
+            self._scheduled = True
+            self.schedule(self.window_ms, self.flush)
+
+    def flush(self):
+        self._scheduled = False
+        pending, self._pending = self._pending, []
+        if not pending:
+            return None
+        uow = UnitOfWork(self.store)
+        try:
+            with uow:
+                for operation, args in pending:
+                    getattr(uow, operation)(*args)
+        except sqlite3.Error as e:
+            # Runs from a Tk after() callback, so report instead of raising
+            logger.error(f"Write batch failed: {str(e)}")
+            uow.result.commit_error = str(e)
+        if self.on_batch:
+            self.on_batch(uow.result)
+        return uow.result
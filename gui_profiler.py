@@ -0,0 +1,286 @@
+"""Opt-in latency and memory profiling for the Tk event loop
+
+Enabled with ``python main.py --profile``. Records how long every Tk
+callback and selected InvoiceApp handlers take, split into time spent in
+SQLite, in Tk calls and in Python; how late the event loop runs its timers;
+and tracemalloc snapshots. On exit it writes a folded-stack trace (input for
+flamegraph.pl, speedscope or inferno) and a summary table.
+"""
+import cProfile
+import functools
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+import tkinter
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime
+
+logger = logging.getLogger('GuiProfiler')
+
+# Handlers timed individually, including when one calls another
+DEFAULT_HANDLERS = (
+    'refresh_invoice_list', 'new_invoice', 'edit_invoice', 'delete_invoice',
+    'bulk_update_invoices', 'print_invoice', 'on_write_batch', 'change_theme',
+)
+
+# cProfile names of C functions whose time counts as SQLite or Tk rather than Python
+_C_KINDS = (("'sqlite3.", 'sqlite'), ("'_tkinter.", 'tk'))
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Timing:
+    """Wall time per call of one handler or callback
+
+    ``nested`` is time spent in other timed scopes called from this one. The
+    cProfile profile runs only while this scope is the innermost one, so its
+    SQLite and Tk shares exclude nested scopes as well.
+    """
+    __slots__ = ('durations', 'nested', 'profile')
+
+    def __init__(self):
+        self.durations = []
+        self.nested = 0.0
+        self.profile = cProfile.Profile()
+
+    def breakdown(self):
+        """Seconds spent in SQLite and in Tk calls, from the C function stats"""
+        shares = {'sqlite': 0.0, 'tk': 0.0}
+        self.profile.create_stats()
+        for (_, _, function), (_, _, own_time, _, _) in self.profile.stats.items():
+            for marker, kind in _C_KINDS:
+                if marker in function:
+                    shares[kind] += own_time
+        return shares['sqlite'], shares['tk']
+
+    def row(self, name):
+        total = sum(self.durations)
+        own = max(total - self.nested, 0.0)
+        in_sqlite, in_tk = self.breakdown()
+        python = max(own - in_sqlite - in_tk, 0.0)
+        return (name, len(self.durations), total * 1000, _percentile(self.durations, 0.95) * 1000,
+                max(self.durations) * 1000, own * 1000, in_sqlite * 1000, in_tk * 1000, python * 1000)
+
+
+class GuiProfiler:
+    """Collects callback timings, event loop lag, memory and stack samples
+
+    ``schedule(delay_ms, callback)`` is Tk's ``root.after``. Call
+    ``install_tk_hooks`` and ``instrument`` before the app builds its
+    widgets, because Tk keeps the callables it was given at creation time.
+    """
+
+    def __init__(self, schedule=None, output_dir='logs/profile', lag_interval_ms=50,
+                 memory_interval_ms=10000, sample_interval_ms=5, tracemalloc_frames=1):
+        self.schedule = schedule
+        self.output_dir = output_dir
+        self.lag_interval_ms = lag_interval_ms
+        self.memory_interval_ms = memory_interval_ms
+        self.sample_interval = sample_interval_ms / 1000
+        self.tracemalloc_frames = tracemalloc_frames
+        self.callbacks = defaultdict(Timing)  # every Tk callback, by target name
+        self.handlers = defaultdict(Timing)  # instrumented methods, by name
+        self.lags = []  # seconds each timer fired late
+        self.memory = []  # (seconds since start, current bytes, peak bytes)
+        self.stacks = Counter()  # tuple of code objects, outermost first -> samples
+        self._active = []  # Timing objects of the callbacks/handlers on the stack
+        self._first_snapshot = None
+        self._last_snapshot = None
+        self._started = None
+        self._running = False
+        self._main_thread = threading.get_ident()
+        self._sampler = None
+        self._original_call = None
+
+    # -- timing ---------------------------------------------------------------
+
+    def timed(self, table, name, func, *args, **kwargs):
+        """Run func, recording its duration under name in table"""
+        timing = table[name]
+        parent = self._active[-1] if self._active else None
+        if parent is not None:
+            parent.profile.disable()
+        self._active.append(timing)
+        timing.profile.enable()
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            timing.profile.disable()
+            timing.durations.append(elapsed)
+            self._active.pop()
+            if parent is not None:
+                parent.nested += elapsed
+                parent.profile.enable()
+
+    def instrument(self, cls, names=DEFAULT_HANDLERS):
+        """Wrap methods of cls so every call, direct or nested, is timed"""
+        for name in names:
+            method = getattr(cls, name, None)
+            if method is None or getattr(method, '__profiled__', False):
+                continue
+
+            @functools.wraps(method)
+            def wrapper(*args, _method=method, _name=name, **kwargs):
+                return self.timed(self.handlers, _name, _method, *args, **kwargs)
+            wrapper.__profiled__ = True
+            setattr(cls, name, wrapper)
+
+    @staticmethod
+    def callback_name(func):
+        """Readable name for a Tk callback, looking through after() wrappers"""
+        if getattr(func, '__name__', None) == 'callit':
+            target = inspect.getclosurevars(func).nonlocals.get('func')
+            if target is not None:
+                func = target
+        name = getattr(func, '__qualname__', None) or type(func).__name__
+        if name.endswith('<lambda>'):
+            code = getattr(func, '__code__', None)
+            if code is not None:
+                name = f"<lambda {os.path.basename(code.co_filename)}:{code.co_firstlineno}>"
+        return name
+
+    def install_tk_hooks(self):
+        """Time every Tk callback (commands, bindings, after) created from now on"""
+        if self._original_call is not None:
+            return
+        profiler = self
+        original = self._original_call = tkinter.CallWrapper.__call__
+
+        def __call__(wrapper, *args):
+            name = wrapper.__dict__.get('_profile_name')
+            if name is None:
+                name = wrapper._profile_name = profiler.callback_name(wrapper.func)
+            if name.startswith('GuiProfiler.') or not profiler._running:
+                return original(wrapper, *args)
+            return profiler.timed(profiler.callbacks, name, original, wrapper, *args)
+        tkinter.CallWrapper.__call__ = __call__
+
+    def remove_tk_hooks(self):
+        if self._original_call is not None:
+            tkinter.CallWrapper.__call__ = self._original_call
+            self._original_call = None
+
+    # -- periodic sampling ------------------------------------------------------
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._started = time.perf_counter()
+        # tracemalloc slows allocation-heavy code several times; 0 frames turns it off
+        if self.tracemalloc_frames:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.tracemalloc_frames)
+            self._first_snapshot = tracemalloc.take_snapshot()
+        self._sampler = threading.Thread(target=self._sample_stacks, name='GuiProfilerSampler',
+                                         daemon=True)
+        self._sampler.start()
+        if self.schedule:
+            self._expected = time.perf_counter() + self.lag_interval_ms / 1000
+            self.schedule(self.lag_interval_ms, self._heartbeat)
+            if self.tracemalloc_frames:
+                self.schedule(self.memory_interval_ms, self._sample_memory)
+        logger.info("GUI profiling started")
+
+    def _heartbeat(self):
+        if not self._running:
+            return
+        now = time.perf_counter()
+        self.lags.append(max(now - self._expected, 0.0))
+        self._expected = now + self.lag_interval_ms / 1000
+        self.schedule(self.lag_interval_ms, self._heartbeat)
+
+    def _sample_memory(self):
+        if not self._running:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        self.memory.append((time.perf_counter() - self._started, current, peak))
+        # Listed in the summary, so a snapshot is not mistaken for an app stall
+        self._last_snapshot = self.timed(self.handlers, 'tracemalloc snapshot', tracemalloc.take_snapshot)
+        self.schedule(self.memory_interval_ms, self._sample_memory)
+
+    def _sample_stacks(self):
+        """Background thread folding the main thread's stack every few milliseconds"""
+        while self._running:
+            frame = sys._current_frames().get(self._main_thread)
+            if frame is not None:
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse()
+                self.stacks[tuple(codes)] += 1
+            time.sleep(self.sample_interval)
+
+    # -- reporting ----------------------------------------------------------------
+
+    def stop(self):
+        """Stop sampling and write the trace and summary; returns their paths"""
+        if not self._running:
+            return None
+        self._running = False
+        if self._sampler is not None:
+            self._sampler.join()
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self.memory.append((time.perf_counter() - self._started, current, peak))
+            self._last_snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        trace_path = os.path.join(self.output_dir, f"gui_profile_{stamp}.folded")
+        with open(trace_path, 'w', encoding='utf-8') as f:
+            for codes, count in self.stacks.most_common():
+                stack = ';'.join(f"{code.co_name} ({os.path.basename(code.co_filename)}:"
+                                 f"{code.co_firstlineno})" for code in codes)
+                f.write(f"{stack} {count}\n")
+        summary = self.summary()
+        summary_path = os.path.join(self.output_dir, f"gui_profile_{stamp}.txt")
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(summary)
+        print(summary)
+        logger.info(f"GUI profile written to {summary_path} and {trace_path}")
+        return trace_path, summary_path
+
+    @staticmethod
+    def _table(title, timings):
+        header = (f"{title:<40} {'calls':>6} {'total ms':>10} {'p95 ms':>8} {'max ms':>8} "
+                  f"{'self ms':>9} {'sqlite ms':>10} {'tk ms':>8} {'python ms':>10}")
+        lines = [header, '-' * len(header)]
+        rows = sorted((timing.row(name) for name, timing in timings.items() if timing.durations),
+                      key=lambda row: row[2], reverse=True)
+        for name, calls, total, p95, worst, own, in_sqlite, in_tk, in_python in rows:
+            lines.append(f"{name[:40]:<40} {calls:>6} {total:>10.1f} {p95:>8.1f} {worst:>8.1f} "
+                         f"{own:>9.1f} {in_sqlite:>10.1f} {in_tk:>8.1f} {in_python:>10.1f}")
+        return lines
+
+    def summary(self):
+        lines = self._table('Handler', self.handlers) + [''] + self._table('Tk callback', self.callbacks)
+        lines.append("self = total minus nested timed handlers; sqlite/tk/python split the self time")
+        if self.lags:
+            stalls = sum(lag > 0.1 for lag in self.lags)
+            lines += ['', f"Event loop lag: p50 {_percentile(self.lags, 0.5) * 1000:.1f} ms, "
+                          f"p95 {_percentile(self.lags, 0.95) * 1000:.1f} ms, "
+                          f"max {max(self.lags) * 1000:.1f} ms, {stalls} stalls over 100 ms "
+                          f"({len(self.lags)} samples)"]
+        if self.memory:
+            _, current, peak = self.memory[-1]
+            lines += ['', f"Traced memory: {current / 1024:.0f} KiB now, {peak / 1024:.0f} KiB peak"]
+        if self._first_snapshot is not None and self._last_snapshot is not None:
+            lines.append("Largest allocation growth:")
+            for stat in self._last_snapshot.compare_to(self._first_snapshot, 'lineno')[:10]:
+                lines.append(f"  {stat}")
+        lines += ['', f"Stack samples: {sum(self.stacks.values())}"]
+        return '\n'.join(lines) + '\n'
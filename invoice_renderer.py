@@ -0,0 +1,201 @@
+import base64
+import html
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from string import Formatter
+from database.settings import AppSettings
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+except ImportError:  # PDF output is optional
+    canvas = None
+
+logger = logging.getLogger('InvoiceRenderer')
+
+DEFAULT_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Invoice {invoice_number}</title>
+<style>body{{font-family:'Segoe UI',sans-serif;margin:40px}}td{{padding:4px 12px}}</style></head>
+<body>
+{logo}
+<h1>Invoice {invoice_number}</h1>
+<table>
+<tr><td>Date</td><td>{date_generated}</td></tr>
+<tr><td>Owner</td><td>{owner}</td></tr>
+<tr><td>Amount</td><td>{full_amount_pending}</td></tr>
+<tr><td>Paid</td><td>{payment_collected}</td></tr>
+<tr><td>Payment date</td><td>{date_of_payment}</td></tr>
+<tr><td>Payment method</td><td>{payment_method}</td></tr>
+<tr><td><strong>Outstanding</strong></td><td><strong>{outstanding}</strong></td></tr>
+</table>
+</body></html>
+"""
+
+PDF_LINES = (
+    ('Date', 'date_generated'), ('Owner', 'owner'), ('Amount', 'full_amount_pending'),
+    ('Paid', 'payment_collected'), ('Payment date', 'date_of_payment'),
+    ('Payment method', 'payment_method'), ('Outstanding', 'outstanding'),
+)
+
+# Per-process resources, loaded once by the pool initializer and reused for every document
+_resources = {}
+
+
+class CompiledTemplate:
+    """Template parsed once into literal chunks and field names"""
+
+    def __init__(self, text):
+        self.parts = [(literal, field) for literal, field, _, _ in Formatter().parse(text)]
+
+    def render(self, context):
+        out = []
+        for literal, field in self.parts:
+            out.append(literal)
+            if field is not None:
+                out.append(context[field])
+        return ''.join(out)
+
+
+def _load_resources(template_path=None, logo_path=None, font_path=None):
+    key = (template_path, logo_path, font_path)
+    if _resources.get('key') == key:
+        return
+    if template_path:
+        with open(template_path, encoding='utf-8') as f:
+            template = f.read()
+    else:
+        template = DEFAULT_TEMPLATE
+    _resources['template'] = CompiledTemplate(template)
+    _resources['logo_html'] = ''
+    _resources['logo_image'] = None
+    if logo_path and os.path.exists(logo_path):
+        with open(logo_path, 'rb') as f:
+            encoded = base64.b64encode(f.read()).decode('ascii')
+        _resources['logo_html'] = f'<img src="data:image/png;base64,{encoded}" height="64">'
+        if canvas is not None:
+            _resources['logo_image'] = ImageReader(logo_path)
+    _resources['font'] = 'Helvetica'
+    if font_path and canvas is not None:
+        pdfmetrics.registerFont(TTFont('InvoiceFont', font_path))
+        _resources['font'] = 'InvoiceFont'
+    _resources['key'] = key
+
+
+def _context(invoice, currency, date_format):
+    values = invoice.as_dict() if hasattr(invoice, 'as_dict') else dict(invoice)
+    # Same field formatters as the invoice list and exports, compiled once per process
+    settings = AppSettings(currency, date_format, ())
+    return {field: html.escape(str(settings.formatter_for(field)(value)))
+            for field, value in values.items()}
+
+
+def _write_html(context, path):
+    context['logo'] = _resources['logo_html']
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(_resources['template'].render(context))
+
+
+def _write_pdf(context, path):
+    pdf = canvas.Canvas(path, pagesize=A4)
+    width, height = A4
+    y = height - 60
+    if _resources['logo_image'] is not None:
+        pdf.drawImage(_resources['logo_image'], 40, y - 40, width=64, height=64, mask='auto')
+        y -= 80
+    pdf.setFont(_resources['font'], 18)
+    pdf.drawString(40, y, f"Invoice {html.unescape(context['invoice_number'])}")
+    pdf.setFont(_resources['font'], 11)
+    for label, field in PDF_LINES:
+        y -= 22
+        pdf.drawString(40, y, label)
+        pdf.drawString(200, y, html.unescape(context[field]))
+    pdf.showPage()
+    pdf.save()
+
+
+def _render_one(invoice, fmt, output_dir, currency, date_format='YYYY-MM-DD'):
+    """Render one invoice in a worker; returns (invoice_number, path, seconds)"""
+    started = time.perf_counter()
+    if 'key' not in _resources:
+        _load_resources()
+    context = _context(invoice, currency, date_format)
+    # The id keeps names unique: numbers can be NULL or differ only in replaced characters
+    name = f"invoice_{invoice.id}"
+    if invoice.invoice_number:
+        name += '_' + ''.join(c if c.isalnum() or c in '-_' else '_' for c in invoice.invoice_number)
+    path = os.path.join(output_dir, f"{name}.{fmt}")
+    if fmt == 'pdf':
+        _write_pdf(context, path)
+    else:
+        _write_html(context, path)
+    return invoice.invoice_number, path, time.perf_counter() - started
+
+
+class InvoiceRenderer:
+    """Render invoices to HTML or PDF files, in parallel for batches"""
+
+    def __init__(self, output_dir='reports', template_path=None, logo_path=None,
+                 font_path=None, currency='USD', date_format='YYYY-MM-DD'):
+        self.output_dir = output_dir
+        self.template_path = template_path
+        self.logo_path = logo_path
+        self.font_path = font_path
+        self.currency = currency
+        self.date_format = date_format
+
+    def _check_format(self, fmt):
+        if fmt not in ('html', 'pdf'):
+            raise ValueError(f"Unsupported format: {fmt}")
+        if fmt == 'pdf' and canvas is None:
+            raise RuntimeError("PDF output requires the reportlab package")
+
+    def render(self, invoice, fmt='html'):
+        """Render a single invoice in this process"""
+        self._check_format(fmt)
+        os.makedirs(self.output_dir, exist_ok=True)
+        _load_resources(self.template_path, self.logo_path, self.font_path)
+        return _render_one(invoice, fmt, self.output_dir, self.currency, self.date_format)
+
+    def render_batch(self, invoices, fmt='html', workers=None):
+        """Render invoices on a process pool, yielding (number, path, seconds) as each finishes"""
+        self._check_format(fmt)
+        os.makedirs(self.output_dir, exist_ok=True)
+        started = time.perf_counter()
+        count = 0
+        # Spawned workers start clean instead of forking the Tk process and its open handles
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_load_resources,
+                                 initargs=(self.template_path, self.logo_path, self.font_path)) as pool:
+            futures = [pool.submit(_render_one, invoice, fmt, self.output_dir, self.currency,
+                                   self.date_format)
+                       for invoice in invoices]
+            for future in as_completed(futures):
+                count += 1
+                yield future.result()
+        logger.info(f"Rendered {count} invoices to {self.output_dir} "
+                    f"in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    import argparse
+    from database.invoice_store import InvoiceFilter, InvoiceStore
+
+    parser = argparse.ArgumentParser(description="Batch render invoices to reports/")
+    parser.add_argument('--start', help="first date_generated (YYYY-MM-DD)")
+    parser.add_argument('--end', help="last date_generated (YYYY-MM-DD)")
+    parser.add_argument('--owner')
+    parser.add_argument('--format', choices=('html', 'pdf'), default='html')
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    store = InvoiceStore()
+    invoices = store.find(InvoiceFilter.build(args.start, args.end, args.owner))
+    store.close()
+    for number, path, seconds in InvoiceRenderer().render_batch(invoices, args.format, args.workers):
+        print(f"{number:<20} {seconds * 1000:8.1f} ms  {path}")
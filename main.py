@@ -1,8 +1,17 @@
+import os
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk
 from ttkbootstrap import Style
-import datetime
-from database.db_handler import get_db_connection, validate_db_schema
+from database.db_handler import DatabaseError, get_db_connection
+from database.invoice_store import InvoiceFilter, InvoiceStore
+from database.migrations import migrate, validate_db_schema
+from database.unit_of_work import GroupCommitter
+from database.archive_manager import ArchiveManager
+from database.maintenance import MaintenanceScheduler
+from database.settings import SettingsService
+from invoice_renderer import InvoiceRenderer
 from PIL import Image, ImageTk
 
 class ToolTip:
@@ -57,6 +66,19 @@ class InvoiceApp:
         
         # Initialize database connection
         self.db_connection = None
+        self.archive = ArchiveManager()
+        self.store = InvoiceStore(archive=self.archive)
+        self.renderer = InvoiceRenderer(output_dir="reports")
+        self.print_job = None
+        self.settings = SettingsService()
+        self.format_row = None
+        # Writes arriving within a few milliseconds share one commit
+        self.writer = GroupCommitter(self.store, window_ms=5, schedule=self.root.after,
+                                     on_batch=self.on_write_batch)
+        # ANALYZE/optimize/incremental vacuum in short slices once the user is idle
+        self.maintenance = MaintenanceScheduler(schedule=self.root.after)
+        for sequence in ("<Any-KeyPress>", "<Any-ButtonPress>", "<Motion>"):
+            self.root.bind_all(sequence, self.maintenance.touch, add="+")
         self.connect_database()
 
     def create_navigation(self):
@@ -167,6 +189,10 @@ class InvoiceApp:
         self.btn_print = ttk.Button(control_frame, image=self.icons["print"], command=self.print_invoice)
         self.btn_print.pack(side="left", padx=2)
         ToolTip(self.btn_print, "Print selected invoice")
+        
+        self.btn_bulk = ttk.Button(control_frame, text="Bulk Update", command=self.bulk_update_invoices)
+        self.btn_bulk.pack(side="left", padx=2)
+        ToolTip(self.btn_bulk, "Set a field on every invoice matching the filters")
 
     def create_settings_tab(self):
         frame = self.tabs["Settings"]
@@ -182,6 +208,23 @@ class InvoiceApp:
         self.theme_menu.pack(side="left", padx=5)
         self.theme_menu.bind("<<ComboboxSelected>>", self.change_theme)
 
+        format_frame = ttk.LabelFrame(frame, text="Invoice Settings")
+        format_frame.pack(fill="x", padx=10, pady=10)
+
+        self.currency_var = tk.StringVar()
+        self.date_format_var = tk.StringVar()
+        self.payment_methods_var = tk.StringVar()
+        ttk.Label(format_frame, text="Currency:").grid(row=0, column=0, sticky="w", padx=5, pady=2)
+        ttk.Entry(format_frame, textvariable=self.currency_var, width=8).grid(row=0, column=1, sticky="w", padx=5)
+        ttk.Label(format_frame, text="Date Format:").grid(row=1, column=0, sticky="w", padx=5, pady=2)
+        ttk.Combobox(format_frame, textvariable=self.date_format_var, width=12,
+                     values=("YYYY-MM-DD", "DD/MM/YYYY", "MM/DD/YYYY", "DD.MM.YYYY")
+                     ).grid(row=1, column=1, sticky="w", padx=5)
+        ttk.Label(format_frame, text="Payment Methods:").grid(row=2, column=0, sticky="w", padx=5, pady=2)
+        ttk.Entry(format_frame, textvariable=self.payment_methods_var, width=60).grid(row=2, column=1, sticky="w", padx=5)
+        ttk.Button(format_frame, image=self.icons["save"], command=self.save_settings
+                   ).grid(row=3, column=1, sticky="w", padx=5, pady=5)
+
     def create_status_bar(self):
         self.status_var = tk.StringVar()
         self.status_bar = ttk.Label(self.root, textvariable=self.status_var, relief="sunken")
@@ -203,13 +246,38 @@ class InvoiceApp:
         try:
             with get_db_connection() as conn:
                 print(f"Connection object: {conn}")  # Debug output
+                migrate(conn)
                 validate_db_schema(conn)
                 self.update_status("Connected to database")
+                self.maintenance.start()
                 print("Database schema validation successful")  # Debug output
+            # Currency, date format and payment methods come from the Settings table
+            self.settings.subscribe(self.apply_settings)
         except Exception as e:
             self.update_status(f"Database error: {str(e)}", error=True)
             print(f"Database connection failed: {str(e)}")  # Debug output
 
+    def apply_settings(self, settings):
+        """Push a new settings snapshot to the widgets, renderer and row formatter"""
+        self.currency_var.set(settings.currency)
+        self.date_format_var.set(settings.date_format)
+        self.payment_methods_var.set(', '.join(settings.payment_methods))
+        self.payment_filter['values'] = ('',) + settings.payment_methods
+        self.renderer.currency = settings.currency
+        self.renderer.date_format = settings.date_format
+        self.format_row = settings.row_formatter()
+
+    def save_settings(self):
+        try:
+            self.settings.update(currency=self.currency_var.get(),
+                                 date_format=self.date_format_var.get(),
+                                 payment_methods=self.payment_methods_var.get())
+        except (ValueError, DatabaseError) as e:
+            self.update_status(f"Settings error: {str(e)}", error=True)
+            return
+        self.update_status("Settings saved")
+        self.refresh_invoice_list()
+
     def update_status(self, message, error=False):
         self.status_var.set(message)
         self.status_bar.config(style="danger.TLabel" if error else "")
@@ -234,12 +302,8 @@ class InvoiceApp:
         if new_data and messagebox.askyesno("Confirm Create", "Create new invoice?"):
             try:
                 date, number, owner, amount = new_data.split(',')
-                with get_db_connection() as conn:
-                    conn.execute('INSERT INTO Invoices (date_generated, invoice_number, owner, full_amount_pending) '
-                               'VALUES (?, ?, ?, ?)', (date, number, owner, float(amount)))
-                    conn.commit()
-                self.update_status("Invoice created successfully")
-                self.refresh_invoice_list()
+                self.writer.submit('add', {'date_generated': date, 'invoice_number': number,
+                                           'owner': owner, 'full_amount_pending': amount})
             except Exception as e:
                 self.update_status(f"Create error: {str(e)}", error=True)
 
@@ -250,22 +314,21 @@ class InvoiceApp:
             self.update_status("No invoice selected", error=True)
             return
             
-        invoice_id = self.tree.item(selected[0])['values'][0]
-        
-        with get_db_connection() as conn:
-            invoice_data = conn.execute('''SELECT date_generated, invoice_number, owner, 
-                                         full_amount_pending, payment_collected, 
-                                         date_of_payment, payment_method 
-                                         FROM Invoices WHERE id=?''', (invoice_id,)).fetchone()
+        # Rows on screen are already cached, so this costs no SQL
+        invoice_id = int(selected[0])
+        invoice = self.store.get(invoice_id)
+        if invoice is None:
+            self.update_status(f"Invoice #{invoice_id} no longer exists", error=True)
+            return
         
         current_values = ','.join([
-            invoice_data[0],  # date_generated
-            invoice_data[1],  # invoice_number
-            invoice_data[2],  # owner
-            str(invoice_data[3]),  # full_amount_pending
-            str(invoice_data[4] if invoice_data[4] else ""),  # payment_collected
-            invoice_data[5] if invoice_data[5] else "",  # date_of_payment
-            invoice_data[6] if invoice_data[6] else ""  # payment_method
+            invoice.date_generated,
+            invoice.invoice_number,
+            invoice.owner,
+            str(invoice.full_amount_pending),
+            str(invoice.payment_collected if invoice.payment_collected else ""),
+            invoice.date_of_payment if invoice.date_of_payment else "",
+            invoice.payment_method if invoice.payment_method else ""
         ])
         
         new_data = simpledialog.askstring("Edit Invoice", 
@@ -278,33 +341,15 @@ class InvoiceApp:
                 if len(parts) != 7:
                     raise ValueError("Invalid number of fields")
                     
-                update_query = '''UPDATE Invoices SET
-                    date_generated = ?,
-                    invoice_number = ?,
-                    owner = ?,
-                    full_amount_pending = ?,
-                    payment_collected = ?,
-                    date_of_payment = ?,
-                    payment_method = ?
-                    WHERE id = ?'''
-                    
-                params = (
-                    parts[0], 
-                    parts[1],
-                    parts[2],
-                    float(parts[3]),
-                    float(parts[4]) if parts[4] else None,
-                    parts[5] if parts[5] else None,
-                    parts[6] if parts[6] else None,
-                    invoice_id
-                )
-                
-                with get_db_connection() as conn:
-                    conn.execute(update_query, params)
-                    conn.commit()
-                    
-                self.update_status(f"Invoice #{invoice_id} updated")
-                self.refresh_invoice_list()
+                self.writer.submit('update', invoice_id, {
+                    'date_generated': parts[0],
+                    'invoice_number': parts[1],
+                    'owner': parts[2],
+                    'full_amount_pending': parts[3],
+                    'payment_collected': parts[4],
+                    'date_of_payment': parts[5],
+                    'payment_method': parts[6] if parts[6] else None
+                })
                 
             except Exception as e:
                 self.update_status(f"Update error: {str(e)}", error=True)
@@ -316,70 +361,151 @@ class InvoiceApp:
             self.update_status("No invoice selected", error=True)
             return
             
-        invoice_id = self.tree.item(selected[0])['values'][0]
-        if messagebox.askyesno("Confirm Delete", f"Delete invoice #{invoice_id}?"):
+        invoice_ids = [int(iid) for iid in selected]
+        label = f"invoice #{invoice_ids[0]}" if len(invoice_ids) == 1 else f"{len(invoice_ids)} invoices"
+        if messagebox.askyesno("Confirm Delete", f"Delete {label}?"):
+            for invoice_id in invoice_ids:
+                self.writer.submit('delete', invoice_id)
+
+    def bulk_update_invoices(self):
+        from tkinter import simpledialog, messagebox
+        field_value = simpledialog.askstring("Bulk Update",
+            "Set a field on all invoices matching the current filters:\nfield=value (e.g. owner=New Clinic)")
+        if not field_value or '=' not in field_value:
+            return
+        field, value = (part.strip() for part in field_value.split('=', 1))
+        if field not in ('owner', 'payment_method', 'date_of_payment', 'payment_collected'):
+            self.update_status(f"Field '{field}' cannot be bulk updated", error=True)
+            return
+        filters = self.current_filters()
+        if filters is None:
+            return
+        # Archived invoices are listed but never updated, so they are not counted
+        count = self.store.count_live(filters)
+        if messagebox.askyesno("Confirm Bulk Update", f"Set {field} on {count} invoices?"):
+            self.writer.submit('update_where', filters, {field: value or None})
+
+    def on_write_batch(self, result):
+        """Report a committed batch of writes and refresh the list"""
+        self.update_status(result.summary(), error=not result.ok)
+        self.refresh_invoice_list()
+
+    def print_invoice(self):
+        import webbrowser
+        if self.print_job is not None:
+            self.update_status("Still rendering the previous batch", error=True)
+            return
+        # Render the selected invoices, or every listed invoice when nothing is selected
+        selected = self.tree.selection() or self.tree.get_children()
+        if not selected:
+            self.update_status("No invoices to print", error=True)
+            return
+            
+        invoices = [self.store.get(int(iid)) for iid in selected]
+        if len(invoices) == 1:
             try:
-                with get_db_connection() as conn:
-                    conn.execute('DELETE FROM Invoices WHERE id=?', (invoice_id,))
-                    conn.commit()
-                self.update_status(f"Invoice #{invoice_id} deleted")
-                self.refresh_invoice_list()
+                _, path, seconds = self.renderer.render(invoices[0])
+                webbrowser.open(os.path.abspath(path))
+                self.update_status(f"Rendered 1 invoice to reports/ ({seconds * 1000:.0f} ms)")
             except Exception as e:
-                self.update_status(f"Delete error: {str(e)}", error=True)
+                self.update_status(f"Print error: {str(e)}", error=True)
+            return
 
-    def print_invoice(self):
-        # Placeholder for printing logic
-        pass
+        # The process pool is driven from a worker thread so the UI stays responsive;
+        # results come back through a queue polled with root.after
+        progress = queue.Queue()
 
-    def refresh_invoice_list(self):
-        self.tree.delete(*self.tree.get_children())
-        query = '''SELECT id, date_generated, invoice_number, owner, outstanding 
-                 FROM Invoices WHERE 1=1'''
-        params = []
-        
-        # Date range filter
-        start_date = self.start_date.get()
-        end_date = self.end_date.get()
-        if start_date and end_date:
+        def render():
             try:
-                datetime.datetime.strptime(start_date, '%Y-%m-%d')
-                datetime.datetime.strptime(end_date, '%Y-%m-%d')
-                query += " AND date_generated BETWEEN ? AND ?"
-                params.extend([start_date, end_date])
-            except ValueError:
-                self.update_status("Invalid date format (use YYYY-MM-DD)", error=True)
-                return
-                
-        # Owner filter
-        owner = self.owner_filter.get()
-        if owner:
-            query += " AND owner = ?"
-            params.append(owner)
-            
-        # Outstanding filter
-        max_outstanding = self.max_outstanding.get()
-        if max_outstanding:
+                for result in self.renderer.render_batch(invoices):
+                    progress.put(result)
+            except Exception as e:
+                progress.put(e)
+            else:
+                progress.put(None)
+
+        self.print_job = threading.Thread(target=render, name="InvoicePrint", daemon=True)
+        self.print_job.start()
+        self.btn_print.state(["disabled"])
+        self.update_status(f"Rendering {len(invoices)} invoices...")
+        self.root.after(50, self.poll_print_job, progress, len(invoices), [])
+
+    def poll_print_job(self, progress, total, results):
+        """Show batch progress; the worker ends with None, or with the exception that stopped it"""
+        while True:
             try:
-                query += " AND outstanding <= ?"
-                params.append(float(max_outstanding))
-            except ValueError:
-                self.update_status("Invalid outstanding amount", error=True)
+                item = progress.get_nowait()
+            except queue.Empty:
+                break
+            if item is None or isinstance(item, Exception):
+                self.print_job = None
+                self.btn_print.state(["!disabled"])
+                if item is None:
+                    slowest = max((seconds for _, _, seconds in results), default=0)
+                    self.update_status(f"Rendered {len(results)} invoice(s) to reports/ "
+                                       f"(slowest {slowest * 1000:.0f} ms)")
+                else:
+                    self.update_status(f"Print error after {len(results)}/{total} invoices: "
+                                       f"{str(item)}", error=True)
                 return
+            results.append(item)
+        self.update_status(f"Rendering invoices... {len(results)}/{total}")
+        self.root.after(50, self.poll_print_job, progress, total, results)
+
+    def current_filters(self):
+        try:
+            return InvoiceFilter.build(start_date=self.start_date.get(),
+                                       end_date=self.end_date.get(),
+                                       owner=self.owner_filter.get(),
+                                       payment_method=self.payment_filter.get(),
+                                       max_outstanding=self.max_outstanding.get())
+        except ArithmeticError:
+            self.update_status("Invalid outstanding amount", error=True)
+        except ValueError:
+            self.update_status("Invalid date format (use YYYY-MM-DD)", error=True)
+        return None
+
+    def refresh_invoice_list(self):
+        self.tree.delete(*self.tree.get_children())
+        filters = self.current_filters()
+        if filters is None:
+            return
                 
-        # Populate owner dropdown
-        with get_db_connection() as conn:
-            owners = [row[0] for row in conn.execute('SELECT DISTINCT owner FROM Invoices')]
-            self.owner_filter['values'] = owners
-            
-        # Execute query
-        with get_db_connection() as conn:
-            try:
-                for row in conn.execute(query, params):
-                    self.tree.insert('', 'end', values=row)
-            except Exception as e:
-                self.update_status(f"Query error: {str(e)}", error=True)
+        # Execute query; repeated filters are served from the cache
+        try:
+            self.settings.refresh()
+            format_row = self.format_row or self.settings.current.row_formatter()
+            self.owner_filter['values'] = self.store.owners()
+            for invoice in self.store.find(filters):
+                self.tree.insert('', 'end', iid=str(invoice.id), values=format_row(invoice))
+        except Exception as e:
+            self.update_status(f"Query error: {str(e)}", error=True)
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Clinic Invoice System")
+    parser.add_argument('--profile', action='store_true',
+                        help="time event loop callbacks and handlers, write a report on exit")
+    parser.add_argument('--profile-dir', default='logs/profile')
+    parser.add_argument('--profile-memory-frames', type=int, default=1,
+                        help="tracemalloc stack depth, 0 to skip memory tracing")
+    args = parser.parse_args()
+
     root = tk.Tk()
+    profiler = None
+    if args.profile:
+        from gui_profiler import GuiProfiler
+        # Hooks must be in place before the widgets register their callbacks
+        profiler = GuiProfiler(schedule=root.after, output_dir=args.profile_dir,
+                               tracemalloc_frames=args.profile_memory_frames)
+        profiler.install_tk_hooks()
+        profiler.instrument(InvoiceApp)
     app = InvoiceApp(root)
-    root.mainloop()
+    if profiler:
+        profiler.start()
+    try:
+        root.mainloop()
+    finally:
+        if profiler:
+            profiler.stop()
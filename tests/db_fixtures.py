@@ -0,0 +1,65 @@
+"""Fast, isolated databases for tests
+
+A migrated template database is built once per test process (once per
+pytest-xdist worker) and every test gets its own copy through the SQLite
+backup API, either as a shared-cache in-memory database or as a file on
+tmpfs when available. Nothing touches database/invoices.db.
+"""
+import atexit
+import itertools
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from database.migrations import migrate_database
+
+TMP_ROOT = '/dev/shm' if os.path.isdir('/dev/shm') else None
+_template_path = None
+_counter = itertools.count()
+
+
+def template_database():
+    """Path of the migrated template database, built on first use"""
+    global _template_path
+    if _template_path is None:
+        template_dir = tempfile.mkdtemp(prefix='clinic_template_', dir=TMP_ROOT)
+        atexit.register(shutil.rmtree, template_dir, True)
+        path = os.path.join(template_dir, 'template.db')
+        migrate_database(path)
+        _template_path = path
+    return _template_path
+
+
+def copy_template(target, uri=False):
+    """Copy the template into target and return the open destination connection"""
+    with sqlite3.connect(template_database()) as src:
+        dst = sqlite3.connect(target, uri=uri)
+        src.backup(dst)
+    return dst
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Gives each test ``db_path``, ``archive_path`` and ``backup_dir`` of its own
+
+    Set ``in_memory = True`` for a shared-cache in-memory copy; the database
+    lives until tearDown closes the keeper connection.
+    """
+    in_memory = False
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='clinic_test_', dir=TMP_ROOT)
+        self.archive_path = os.path.join(self.tmp_dir, 'invoices_archive.db')
+        self.backup_dir = os.path.join(self.tmp_dir, 'backups')
+        if self.in_memory:
+            self.db_path = f"file:clinic_test_{os.getpid()}_{next(_counter)}?mode=memory&cache=shared"
+            self._keeper = copy_template(self.db_path, uri=True)
+        else:
+            self.db_path = os.path.join(self.tmp_dir, 'invoices.db')
+            copy_template(self.db_path).close()
+            self._keeper = None
+
+    def tearDown(self):
+        if self._keeper is not None:
+            self._keeper.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
@@ -0,0 +1,76 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+from database.archive_manager import ArchiveManager
+from database.backup_manager import BackupManager
+from database.db_handler import to_cents, to_day
+from database.migrations import LEGACY_INVOICES_TABLE
+
+class TestArchiveManager(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, 'invoices.db')
+        self.archive_path = os.path.join(self.tmp_dir, 'archive.db')
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(LEGACY_INVOICES_TABLE.format(table='Invoices'))
+            conn.executemany('''INSERT INTO Invoices
+                (date_generated, invoice_number, owner, full_amount_pending, payment_collected)
+                VALUES (?,?,?,?,?)''', [
+                ('2020-01-01', 'INV-OLD-PAID', 'Clinic A', 100.0, 100.0),
+                ('2020-01-02', 'INV-OLD-OPEN', 'Clinic A', 100.0, 40.0),
+                ('2099-01-01', 'INV-NEW-PAID', 'Clinic B', 50.0, 50.0),
+            ])
+        self.manager = ArchiveManager(self.db_path, self.archive_path, retention_days=365)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_only_old_settled_invoices_move(self):
+        self.assertEqual(self.manager.archive_settled(batch_size=1), 1)
+        with sqlite3.connect(self.db_path) as conn:
+            live = {row[0] for row in conn.execute("SELECT invoice_number FROM Invoices")}
+        self.assertEqual(live, {'INV-OLD-OPEN', 'INV-NEW-PAID'})
+        self.assertEqual(self.manager.archived_through(), to_day('2020-01-01'))
+
+    def test_archive_attached_only_for_archived_ranges(self):
+        self.manager.archive_settled()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self.assertEqual(self.manager.invoice_source(conn, '2021-01-01'), 'main.Invoices')
+            source = self.manager.invoice_source(conn, '2019-01-01')
+            count = conn.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+            self.assertEqual(count, 3)
+        finally:
+            conn.close()
+
+    def test_archived_ids_are_never_reused(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE Invoices SET date_generated = '2020-01-01', payment_collected = full_amount_pending")
+        self.assertEqual(self.manager.archive_settled(), 3)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany('''INSERT INTO Invoices
+                (date_generated, invoice_number, full_amount_pending, payment_collected)
+                VALUES (?, ?, ?, ?)''', [(to_day('2020-02-01'), f'INV-NEXT-{i}', to_cents(10), to_cents(10))
+                                         for i in range(3)])
+            new_ids = [row[0] for row in conn.execute("SELECT id FROM Invoices ORDER BY id")]
+        self.assertEqual(new_ids, [4, 5, 6])
+        self.assertEqual(self.manager.archive_settled(), 3)
+        with sqlite3.connect(self.archive_path) as conn:
+            archived = [row[0] for row in conn.execute("SELECT id FROM Invoices ORDER BY id")]
+        self.assertEqual(archived, [1, 2, 3, 4, 5, 6])
+
+    def test_archive_lives_next_to_the_database(self):
+        self.assertEqual(ArchiveManager(self.db_path).archive_path,
+                         os.path.join(self.tmp_dir, 'invoices_archive.db'))
+
+    def test_unchanged_archive_is_not_backed_up_twice(self):
+        self.manager.archive_settled()
+        backups = BackupManager(self.db_path, os.path.join(self.tmp_dir, 'backups'),
+                                self.archive_path)
+        self.assertIsNotNone(backups.backup_archive('20240101_000000'))
+        self.assertIsNone(backups.backup_archive('20240101_000001'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+import os
+import sqlite3
+from database.backup_manager import BackupManager, RestoreConflict
+from database.change_journal import UPDATE, ChangeJournal
+from database.db_handler import get_db_connection, to_cents, to_day
+from db_fixtures import DatabaseTestCase
+
+class TestBackupCatalog(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        with get_db_connection(self.db_path) as conn:
+            conn.executemany('''INSERT INTO Invoices
+                (id, date_generated, invoice_number, owner, full_amount_pending)
+                VALUES (?, ?, ?, ?, ?)''',
+                [(i, to_day(f'2024-01-{i:02d}'), f'INV-{i}', 'Clinic', to_cents(100))
+                 for i in range(1, 11)])
+            conn.commit()
+        self.backups = BackupManager(self.db_path, self.backup_dir, self.archive_path)
+        self.backup = self.backups.create_backup(manual=True)
+
+    def live(self, sql, params=()):
+        with get_db_connection(self.db_path) as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def test_backup_is_cataloged(self):
+        entry = self.backups.list_backups()[0]
+        self.assertEqual(self.backups.backup_path(entry), self.backup)
+        self.assertEqual(entry['kind'], 'manual')
+        self.assertEqual(entry['invoice_count'], 10)
+        self.assertEqual((entry['min_date'], entry['max_date']), ('2024-01-01', '2024-01-10'))
+        self.assertEqual(entry['size_bytes'], os.path.getsize(self.backup))
+        self.assertTrue(self.backups.verify_backup(self.backup))
+        self.assertEqual(self.backups.backup_at(entry['created_at']), self.backup)
+        self.assertIsNone(self.backups.backup_at('2000-01-01T00:00:00'))
+
+        with open(self.backup, 'ab') as f:
+            f.write(b'\0')
+        self.assertFalse(self.backups.verify_backup(self.backup))
+
+    def test_catalog_is_rebuilt_from_backup_dir(self):
+        os.remove(self.backups.catalog_path)
+        legacy = os.path.join(self.backup_dir, 'invoice_backup_20230102_030405_auto.db')
+        with sqlite3.connect(legacy) as conn:
+            conn.execute('''CREATE TABLE Invoices (id INTEGER PRIMARY KEY, date_generated TEXT,
+                invoice_number TEXT, owner TEXT, full_amount_pending REAL, payment_collected REAL,
+                date_of_payment TEXT, date_of_last_payment TEXT, payment_method TEXT)''')
+            conn.execute("INSERT INTO Invoices VALUES (1, '2023-01-01', 'INV-1', 'Legacy', 12.5, 0, NULL, NULL, NULL)")
+        conn.close()
+
+        entries = self.backups.list_backups()
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(self.backups.backup_at('2023-06-01T00:00:00'), legacy)
+        self.assertEqual(entries[-1]['min_date'], '2023-01-01')
+
+        self.assertEqual(self.backups.restore_invoices(legacy, invoice_ids=[1]), 1)
+        self.assertEqual(self.live("SELECT full_amount_pending FROM Invoices WHERE id = 1")[0][0], 12.5)
+
+    def test_selective_restore_and_diff(self):
+        with get_db_connection(self.db_path) as conn:
+            conn.execute("DELETE FROM Invoices WHERE id IN (2, 3)")
+            conn.execute("UPDATE Invoices SET owner = 'Changed' WHERE id IN (4, 8)")
+            conn.execute('''INSERT INTO Invoices (id, date_generated, invoice_number, full_amount_pending)
+                VALUES (11, ?, 'INV-11', ?)''', (to_day('2024-01-05'), to_cents(1)))
+            conn.commit()
+
+        diff = self.backups.diff(self.backup)
+        self.assertEqual((diff.added, diff.removed, diff.changed), ([11], [2, 3], [4, 8]))
+        self.assertEqual(self.backups.diff(self.backup, start_date='2024-01-01', end_date='2024-01-05'),
+                         ([11], [2, 3], [4]))
+
+        self.assertEqual(self.backups.restore_invoices(self.backup, invoice_ids=[2]), 1)
+        self.assertEqual(self.backups.restore_invoices(
+            self.backup, start_date='2024-01-03', end_date='2024-01-05', delete_missing=True), 3)
+        self.assertEqual(self.backups.diff(self.backup), ([], [], [8]))
+        self.assertEqual(self.live("SELECT owner FROM Invoices WHERE id = 4")[0][0], 'Clinic')
+
+    def test_restore_never_deletes_invoices_sharing_a_number(self):
+        with get_db_connection(self.db_path) as conn:
+            conn.execute("DELETE FROM Invoices WHERE id = 1")
+            conn.execute("UPDATE Invoices SET invoice_number = 'INV-1' WHERE id = 2")
+            conn.commit()
+        journal = ChangeJournal(self.db_path)
+        try:
+            after = journal.latest_seq()
+            with self.assertRaises(RestoreConflict) as raised:
+                self.backups.restore_invoices(self.backup, invoice_ids=[1])
+            self.assertEqual(raised.exception.conflicts, [(1, 'INV-1', 2)])
+            self.assertEqual([row[0] for row in self.live(
+                "SELECT id FROM Invoices WHERE invoice_number = 'INV-1'")], [2])
+
+            self.assertEqual(self.backups.restore_invoices(self.backup, invoice_ids=[3]), 1)
+            self.assertEqual(journal.net_changes(after), {3: UPDATE})
+        finally:
+            journal.close()
+
+    def test_restored_payment_dates_are_kept(self):
+        with get_db_connection(self.db_path) as conn:
+            conn.execute("UPDATE Invoices SET payment_collected = full_amount_pending WHERE id = 3")
+            conn.execute("UPDATE Invoices SET date_of_payment = NULL, date_of_last_payment = ? WHERE id = 3",
+                         (to_day('2024-02-02'),))
+            conn.commit()
+        backup = self.backups.create_backup()
+        with get_db_connection(self.db_path) as conn:
+            conn.execute("UPDATE Invoices SET payment_collected = 0, owner = 'Changed' WHERE id = 3")
+            conn.commit()
+        self.assertEqual(self.backups.restore_invoices(backup, invoice_ids=[3]), 1)
+        self.assertFalse(self.backups.diff(backup))
+        row = self.live("SELECT date_of_payment, date_of_last_payment FROM Invoices WHERE id = 3")[0]
+        self.assertEqual(tuple(row), (None, '2024-02-02'))
+
+    def test_missing_backup_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.backups.restore_invoices(os.path.join(self.backup_dir, 'nope.db'), invoice_ids=[1])
+
+class TestBackupCatalogInMemory(TestBackupCatalog):
+    """Selective restore into a shared-cache in-memory live database"""
+    in_memory = True
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import os
+from database.archive_manager import ArchiveManager
+from database.change_journal import ARCHIVE, DELETE, INSERT, UPDATE, ChangeJournal, ChangesCompacted
+from database.invoice_store import InvoiceStore
+from db_fixtures import DatabaseTestCase
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+class TestChangeJournal(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = InvoiceStore(self.db_path, ArchiveManager(self.db_path, self.archive_path))
+        self.journal = ChangeJournal(self.db_path)
+        with self.store.unit_of_work() as uow:
+            for i in range(1, 4):
+                uow.add({'date_generated': '2020-01-01', 'invoice_number': f'INV-{i}',
+                         'full_amount_pending': '10'})
+
+    def tearDown(self):
+        self.journal.close()
+        self.store.close()
+        super().tearDown()
+
+    def test_writes_are_journaled_in_order(self):
+        self.store.update(1, {'owner': 'Changed'})
+        self.store.delete(2)
+        changes = list(self.journal.changes_after(0, batch_size=2))
+        self.assertEqual([(c.invoice_id, c.op) for c in changes],
+                         [(1, INSERT), (2, INSERT), (3, INSERT), (1, UPDATE), (2, DELETE)])
+        self.assertEqual([c.seq for c in changes], sorted(c.seq for c in changes))
+        self.assertEqual(self.journal.net_changes(3), {1: UPDATE, 2: DELETE})
+
+    def test_compaction_follows_slowest_consumer(self):
+        self.journal.commit('dashboard', 3)
+        self.journal.commit('accounting', 1)
+        self.store.update(3, {'owner': 'Changed'})
+        self.assertEqual(self.journal.compact(), 1)
+        self.assertEqual([c.invoice_id for c in self.journal.changes_after(1)], [2, 3, 3])
+
+        self.journal.forget('accounting')
+        self.assertEqual(self.journal.compact(), 2)
+        with self.assertRaises(ChangesCompacted):
+            list(self.journal.changes_after(1))
+        self.assertEqual(self.journal.net_changes(3), {3: UPDATE})
+
+        self.assertEqual(self.journal.compact(upto=self.journal.latest_seq()), 1)
+        self.assertEqual(self.journal.compacted_through(), 4)
+        self.store.delete(1)
+        self.assertEqual(list(self.journal.net_changes(4).items()), [(1, DELETE)])
+
+    def test_archival_is_not_reported_as_delete(self):
+        self.store.update(1, {'payment_collected': '10'})
+        after = self.journal.latest_seq()
+        self.assertEqual(self.store.archive.archive_settled(), 1)
+        self.assertEqual(self.journal.net_changes(after), {1: ARCHIVE})
+
+    @unittest.skipIf(pandas is None, "pandas is not installed")
+    def test_incremental_export(self):
+        from database.export_manager import ExportManager
+        exports = ExportManager(self.db_path, self.archive_path)
+        first = exports.export_changes('sync', output_path=os.path.join(self.tmp_dir, 'first.csv'))
+        self.assertEqual(len(pandas.read_csv(first)), 3)
+        self.assertIsNone(exports.export_changes('sync', output_path=os.path.join(self.tmp_dir, 'none.csv')))
+
+        self.store.update(1, {'owner': 'Changed'})
+        self.store.delete(2)
+        second = pandas.read_csv(exports.export_changes(
+            'sync', output_path=os.path.join(self.tmp_dir, 'second.csv')))
+        self.assertEqual(sorted(zip(second['change'], second['id'])), [('delete', 2), ('upsert', 1)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import shutil
+import sqlite3
+import tempfile
+import time
+import tkinter
+from gui_profiler import GuiProfiler
+
+class FakeApp:
+    def __init__(self):
+        self.conn = sqlite3.connect(':memory:')
+
+    def refresh_invoice_list(self):
+        self.conn.execute('''WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 50000)
+            SELECT SUM(x) FROM c''').fetchone()
+
+    def on_write_batch(self):
+        self.refresh_invoice_list()
+        time.sleep(0.02)
+
+class TestGuiProfiler(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.scheduled = []
+        self.profiler = GuiProfiler(schedule=lambda ms, cb: self.scheduled.append(cb),
+                                    output_dir=self.tmp_dir, sample_interval_ms=1)
+
+    def tearDown(self):
+        self.profiler.remove_tk_hooks()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_nested_handlers_are_split(self):
+        class App(FakeApp):
+            pass
+        self.profiler.instrument(App, ('refresh_invoice_list', 'on_write_batch', 'missing'))
+        self.profiler.start()
+        App().on_write_batch()
+        outer = self.profiler.handlers['on_write_batch'].row('on_write_batch')
+        inner = self.profiler.handlers['refresh_invoice_list'].row('refresh_invoice_list')
+        self.assertEqual((outer[1], inner[1]), (1, 1))
+        self.assertGreaterEqual(outer[2], inner[2] + 20)
+        self.assertAlmostEqual(outer[5], outer[2] - inner[2], places=3)
+        self.assertEqual(outer[6], 0.0)  # its SQLite work happened in the nested handler
+        self.assertGreater(inner[6], 0.0)
+        self.profiler.stop()
+
+    def test_tk_callbacks_and_event_loop_lag(self):
+        self.profiler.install_tk_hooks()
+        app = FakeApp()
+        wrapper = tkinter.CallWrapper(app.refresh_invoice_list, None, None)
+        self.profiler.start()
+        wrapper()
+        self.assertEqual(len(self.profiler.callbacks['FakeApp.refresh_invoice_list'].durations), 1)
+
+        heartbeat = self.scheduled[0]
+        self.profiler._expected = time.perf_counter() - 0.2
+        heartbeat()
+        self.assertGreaterEqual(self.profiler.lags[-1], 0.2)
+
+        trace_path, summary_path = self.profiler.stop()
+        with open(summary_path, encoding='utf-8') as f:
+            summary = f.read()
+        self.assertIn('FakeApp.refresh_invoice_list', summary)
+        self.assertIn('1 stalls over 100 ms', summary)
+        with open(trace_path, encoding='utf-8') as f:
+            for line in f:
+                stack, count = line.rsplit(' ', 1)
+                self.assertTrue(stack and int(count) > 0)
+
+    def test_after_callbacks_are_named_by_target(self):
+        def refresh():
+            pass
+
+        def callit():
+            return refresh()
+        self.assertTrue(GuiProfiler.callback_name(callit).endswith('callit'))
+
+        func = refresh
+        def callit():  # same shape as the wrapper Misc.after registers
+            return func()
+        self.assertTrue(GuiProfiler.callback_name(callit).endswith('refresh'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+from decimal import Decimal
+from database.db_handler import DBHandler, to_cents, to_day, from_cents, from_day
+from database.migrations import LEGACY_INVOICES_TABLE, upgrade_invoice_storage
+
+class TestIntegerStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, 'invoices.db')
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(LEGACY_INVOICES_TABLE.format(table='Invoices'))
+            conn.executemany('''INSERT INTO Invoices
+                (date_generated, invoice_number, owner, full_amount_pending, payment_collected)
+                VALUES (?,?,?,?,?)''',
+                [(f'2024-01-{i:02d}T10:30:00', f'INV-{i}', 'Clinic', 0.1 * i + 0.2, 0.1 * i)
+                 for i in range(1, 21)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_codecs_round_trip(self):
+        self.assertEqual(to_cents('10.005'), 1001)
+        self.assertEqual(from_cents(1001), Decimal('10.01'))
+        self.assertEqual(to_day('1970-01-02T23:59:00'), 1)
+        self.assertEqual(from_day(to_day('2024-02-29')), '2024-02-29')
+        self.assertIsNone(to_cents(''))
+
+    def test_upgrade_converts_and_decodes(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self.assertTrue(upgrade_invoice_storage(conn, batch_size=7))
+            self.assertFalse(upgrade_invoice_storage(conn))
+            raw = conn.execute("SELECT date_generated, outstanding FROM Invoices WHERE id = 3").fetchone()
+            self.assertEqual(raw, (to_day('2024-01-03'), 20))
+        finally:
+            conn.close()
+
+        with DBHandler(self.db_path) as conn:
+            row = conn.execute("SELECT * FROM Invoices WHERE invoice_number = 'INV-3'").fetchone()
+            self.assertEqual(row['date_generated'], '2024-01-03')
+            self.assertEqual(row['full_amount_pending'], Decimal('0.50'))
+            self.assertEqual(row['outstanding'], Decimal('0.20'))
+
+    def test_writes_during_copy_are_replayed(self):
+        def concurrent_write(table, done, total):
+            if done == 5:
+                with sqlite3.connect(self.db_path) as other:
+                    other.execute("DELETE FROM Invoices WHERE id = 1")
+                    other.execute("UPDATE Invoices SET owner = 'Moved' WHERE id = 2")
+                    other.execute('''INSERT INTO Invoices (date_generated, invoice_number, full_amount_pending)
+                        VALUES ('2024-02-01', 'INV-LATE', 5.0)''')
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            upgrade_invoice_storage(conn, batch_size=5, progress=concurrent_write)
+            self.assertIsNone(conn.execute("SELECT 1 FROM Invoices WHERE id = 1").fetchone())
+            self.assertEqual(conn.execute("SELECT owner FROM Invoices WHERE id = 2").fetchone()[0], 'Moved')
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM Invoices").fetchone()[0], 20)
+        finally:
+            conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
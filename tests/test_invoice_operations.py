@@ -2,135 +2,105 @@ import unittest
 import os
 import sqlite3
 from datetime import datetime
-from database.db_handler import get_db_connection, DatabaseError
+from database.db_handler import get_db_connection, DatabaseError, to_cents, to_day
 from database.backup_manager import BackupManager
+from db_fixtures import DatabaseTestCase
 
-class TestInvoiceOperations(unittest.TestCase):
-    def setUp(self):
-        """Create fresh database for each test"""
-        # Ensure all connections are closed
-        from database.db_handler import _active_connections
-        for conn in list(_active_connections):
-            conn.close()
-            _active_connections.remove(conn)
-            
-        # Remove existing database
-        try:
-            os.remove('database/invoices.db')
-        except FileNotFoundError:
-            pass
-        except PermissionError:
-            os.system('taskkill /f /im python.exe')
-            os.remove('database/invoices.db')
-            
-        os.makedirs('database', exist_ok=True)
-        os.makedirs('backups', exist_ok=True)
-        
-        # Initialize schema
-        with get_db_connection() as conn:
-            conn.execute('''CREATE TABLE Invoices (
-                id INTEGER PRIMARY KEY,
-                date_generated TEXT NOT NULL,
-                invoice_number TEXT UNIQUE,
-                owner TEXT,
-                full_amount_pending REAL,
-                payment_collected REAL,
-                date_of_payment TEXT,
-                date_of_last_payment TEXT,
-                payment_method TEXT,
-                outstanding REAL
-            )''')
-            conn.commit()
-
-    def tearDown(self):
-        """Clean up after each test"""
-        from database.db_handler import _active_connections
-        # Close all connections first
-        for conn in list(_active_connections):
-            conn.close()
-            _active_connections.remove(conn)
-            
-        # Remove test database
-        try:
-            os.remove('database/invoices.db')
-        except (FileNotFoundError, PermissionError):
-            pass
-            
-        # Cleanup backup files
-        for f in os.listdir('backups'):
-            try:
-                os.remove(os.path.join('backups', f))
-            except (PermissionError, FileNotFoundError):
-                pass
+class TestInvoiceOperations(DatabaseTestCase):
+    """Each test runs against its own copy of the migrated template database"""
 
     def test_zero_outstanding_calculation(self):
         """Test invoice with full payment shows 0 outstanding"""
-        with get_db_connection() as conn:
+        with get_db_connection(self.db_path) as conn:
             test_data = (
-                datetime.now().isoformat(),
+                to_day(datetime.now()),
                 'INV-001',
                 'Test Clinic',
-                1000.0,
-                1000.0,  # Full payment
-                datetime.now().isoformat(),
+                to_cents(1000.0),
+                to_cents(1000.0),  # Full payment
+                to_day(datetime.now()),
                 None,
-                'Cash',
-                0.0
+                'Cash'
             )
-            conn.execute('''INSERT INTO Invoices VALUES 
-                (NULL,?,?,?,?,?,?,?,?,?)''', test_data)
-            
+            conn.execute('''INSERT INTO Invoices VALUES
+                (NULL,?,?,?,?,?,?,?,?)''', test_data)
+
             result = conn.execute("SELECT outstanding FROM Invoices WHERE invoice_number = 'INV-001'").fetchone()
             self.assertEqual(result['outstanding'], 0.0)
 
     def test_duplicate_invoice_prevention(self):
         """Test duplicate invoice numbers are rejected"""
-        with get_db_connection() as conn:
+        with get_db_connection(self.db_path) as conn:
             # First insert should succeed
-            conn.execute('''INSERT INTO Invoices 
+            conn.execute('''INSERT INTO Invoices
                 (date_generated, invoice_number, owner, full_amount_pending, payment_collected)
-                VALUES (?,?,?,?,?)''', 
-                (datetime.now().isoformat(), 'INV-002', 'Test Clinic', 500.0, 250.0))
-            
+                VALUES (?,?,?,?,?)''',
+                (to_day(datetime.now()), 'INV-002', 'Test Clinic', to_cents(500.0), to_cents(250.0)))
+
             # Second insert with same number should fail
             with self.assertRaises(sqlite3.IntegrityError):
-                conn.execute('''INSERT INTO Invoices 
+                conn.execute('''INSERT INTO Invoices
                     (date_generated, invoice_number, owner, full_amount_pending, payment_collected)
-                    VALUES (?,?,?,?,?)''', 
-                    (datetime.now().isoformat(), 'INV-002', 'Another Clinic', 700.0, 300.0))
+                    VALUES (?,?,?,?,?)''',
+                    (to_day(datetime.now()), 'INV-002', 'Another Clinic', to_cents(700.0), to_cents(300.0)))
+
+    def test_unencoded_values_rejected(self):
+        """Test raw floats and ISO strings cannot bypass the integer encoding"""
+        with get_db_connection(self.db_path) as conn:
+            with self.assertRaises(DatabaseError):
+                conn.execute('''INSERT INTO Invoices
+                    (date_generated, invoice_number, full_amount_pending)
+                    VALUES (?,?,?)''', (datetime.now().isoformat(), 'INV-003', 10.5))
 
     def test_backup_recovery_integrity(self):
         """Test full backup/restore cycle maintains data integrity"""
         # Create test data
-        with get_db_connection() as conn:
-            conn.execute('''INSERT INTO Invoices 
+        with get_db_connection(self.db_path) as conn:
+            conn.execute('''INSERT INTO Invoices
                 (date_generated, invoice_number, owner, full_amount_pending)
-                VALUES (?,?,?,?)''', 
-                (datetime.now().isoformat(), 'INV-BACKUP-TEST', 'Backup Clinic', 1500.0))
-            
+                VALUES (?,?,?,?)''',
+                (to_day(datetime.now()), 'INV-BACKUP-TEST', 'Backup Clinic', to_cents(1500.0)))
+            conn.commit()
+
         # Create backup
-        backup_path = BackupManager().create_backup(manual=True)
-        
-        # Close all connections before file operations
-        from database.db_handler import _active_connections
-        for conn in list(_active_connections):
-            conn.close()
-            _active_connections.remove(conn)
-            
+        backups = BackupManager(self.db_path, self.backup_dir, self.archive_path)
+        backup_path = backups.create_backup(manual=True)
+
         # Corrupt database
-        try:
-            os.remove('database/invoices.db')
-        except PermissionError:
-            pass  # Handle Windows file locking race condition
-        
+        os.remove(self.db_path)
+
         # Restore backup
-        BackupManager().restore_backup(backup_path)
-        
+        self.assertTrue(backups.restore_backup(backup_path))
+
         # Verify recovery
-        with get_db_connection() as conn:
+        with get_db_connection(self.db_path) as conn:
             result = conn.execute("SELECT * FROM Invoices WHERE invoice_number = 'INV-BACKUP-TEST'").fetchone()
             self.assertEqual(result['owner'], 'Backup Clinic')
             self.assertEqual(result['full_amount_pending'], 1500.0)
 
+class TestInvoiceOperationsInMemory(TestInvoiceOperations):
+    """Same checks against shared-cache in-memory copies"""
+    in_memory = True
+
+    def test_backup_recovery_integrity(self):
+        """Restore into the in-memory database instead of deleting a file"""
+        with get_db_connection(self.db_path) as conn:
+            conn.execute('''INSERT INTO Invoices
+                (date_generated, invoice_number, owner, full_amount_pending)
+                VALUES (?,?,?,?)''',
+                (to_day(datetime.now()), 'INV-BACKUP-TEST', 'Backup Clinic', to_cents(1500.0)))
+            conn.commit()
+        backups = BackupManager(self.db_path, self.backup_dir, self.archive_path)
+        backup_path = backups.create_backup(manual=True)
+
+        with get_db_connection(self.db_path) as conn:
+            conn.execute("DELETE FROM Invoices")
+            conn.commit()
+        self.assertTrue(backups.restore_backup(backup_path))
+
+        with get_db_connection(self.db_path) as conn:
+            result = conn.execute("SELECT * FROM Invoices WHERE invoice_number = 'INV-BACKUP-TEST'").fetchone()
+            self.assertEqual(result['owner'], 'Backup Clinic')
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from database.models import Invoice
+from invoice_renderer import CompiledTemplate, InvoiceRenderer
+
+def make_invoice(invoice_id, number):
+    return Invoice(invoice_id, '2024-03-01', number, 'Clinic <A>', Decimal('100.00'),
+                   Decimal('40.00'), '2024-03-05', None, 'Cash', Decimal('60.00'))
+
+class TestInvoiceRenderer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.renderer = InvoiceRenderer(output_dir=self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_compiled_template(self):
+        template = CompiledTemplate("{a} and {{literal}} {b}")
+        self.assertEqual(template.render({'a': '1', 'b': '2'}), "1 and {literal} 2")
+
+    def test_single_invoice_is_escaped(self):
+        number, path, seconds = self.renderer.render(make_invoice(1, 'INV/001'))
+        self.assertEqual(os.path.basename(path), 'invoice_1_INV_001.html')
+        with open(path, encoding='utf-8') as f:
+            content = f.read()
+        self.assertIn('Clinic &lt;A&gt;', content)
+        self.assertIn('USD 60.00', content)
+
+    def test_batch_renders_every_invoice(self):
+        invoices = [make_invoice(i, f'INV-{i}') for i in range(1, 6)]
+        results = list(self.renderer.render_batch(invoices, workers=2))
+        self.assertEqual(sorted(number for number, _, _ in results), [f'INV-{i}' for i in range(1, 6)])
+        self.assertEqual(len(os.listdir(self.tmp_dir)), 5)
+
+    def test_similar_or_missing_numbers_get_separate_files(self):
+        invoices = [make_invoice(1, 'INV/1'), make_invoice(2, 'INV_1'),
+                    make_invoice(3, None), make_invoice(4, None)]
+        paths = {path for _, path, _ in self.renderer.render_batch(invoices, workers=2)}
+        self.assertEqual(len(paths), 4)
+        self.assertEqual(len(os.listdir(self.tmp_dir)), 4)
+
+if __name__ == '__main__':
+    unittest.main()
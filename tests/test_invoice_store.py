@@ -0,0 +1,69 @@
+import unittest
+import sqlite3
+from decimal import Decimal
+from database.archive_manager import ArchiveManager
+from database.invoice_store import InvoiceFilter, InvoiceStore
+from db_fixtures import DatabaseTestCase
+
+class TestInvoiceStore(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        archive = ArchiveManager(self.db_path, self.archive_path)
+        self.store = InvoiceStore(self.db_path, archive)
+        for number, owner, amount in (('INV-1', 'Clinic A', '100.00'),
+                                      ('INV-2', 'Clinic A', '50.00'),
+                                      ('INV-3', 'Clinic B', '75.50')):
+            self.store.create({'date_generated': '2024-03-01', 'invoice_number': number,
+                               'owner': owner, 'full_amount_pending': amount})
+        self.statements = []
+        self.store.connection.set_trace_callback(self.statements.append)
+
+    def tearDown(self):
+        self.store.close()
+        super().tearDown()
+
+    def queries(self):
+        return [s for s in self.statements if not s.startswith('PRAGMA data_version')]
+
+    def test_filter_normalization(self):
+        self.assertEqual(InvoiceFilter.build(owner=' Clinic A ', max_outstanding='10'),
+                         InvoiceFilter.build(owner='Clinic A', max_outstanding='10.00'))
+        self.assertIsNone(InvoiceFilter.build(start_date='2024-01-01').start_date)
+        with self.assertRaises(ValueError):
+            InvoiceFilter.build(start_date='2024-13-01', end_date='2024-12-01')
+
+    def test_repeated_filter_and_visible_row_cost_no_sql(self):
+        filters = InvoiceFilter.build(owner='Clinic A')
+        invoices = self.store.find(filters)
+        self.assertEqual([inv.invoice_number for inv in invoices], ['INV-1', 'INV-2'])
+        self.statements.clear()
+        self.assertIs(self.store.find(InvoiceFilter.build(owner='Clinic A ')), invoices)
+        self.assertEqual(self.store.get(invoices[0].id).full_amount_pending, Decimal('100.00'))
+        self.assertEqual(self.queries(), [])
+
+    def test_writes_invalidate_only_affected_results(self):
+        clinic_a = InvoiceFilter.build(owner='Clinic A')
+        clinic_b = InvoiceFilter.build(owner='Clinic B')
+        self.store.find(clinic_a)
+        cached_b = self.store.find(clinic_b)
+        invoice = self.store.find(clinic_a)[0]
+        self.store.update(invoice.id, {'owner': 'Clinic C'})
+        self.assertIs(self.store.find(clinic_b), cached_b)
+        self.assertEqual(len(self.store.find(clinic_a)), 1)
+
+    def test_live_count_excludes_archived_invoices(self):
+        self.store.update(1, {'payment_collected': '100.00', 'date_generated': '2020-01-01'})
+        self.store.archive.archive_settled()
+        everything = InvoiceFilter.build(start_date='2019-01-01', end_date='2030-01-01')
+        self.assertEqual(len(self.store.find(everything)), 3)
+        self.assertEqual(self.store.count_live(everything), 2)
+
+    def test_external_commit_drops_cache(self):
+        filters = InvoiceFilter.build()
+        self.assertEqual(len(self.store.find(filters)), 3)
+        with sqlite3.connect(self.db_path) as other:
+            other.execute("DELETE FROM Invoices WHERE invoice_number = 'INV-3'")
+        self.assertEqual(len(self.store.find(filters)), 2)
+
+if __name__ == '__main__':
+    unittest.main()
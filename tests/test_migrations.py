@@ -0,0 +1,114 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+from database.db_handler import archive_path_for
+from database.migrations import (INVOICES_TABLE, LATEST_VERSION, migrate, migrate_database,
+                                 validate_db_schema, verify_schema)
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, 'invoices.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_fresh_database_reaches_latest_version(self):
+        self.assertEqual(migrate_database(self.db_path), LATEST_VERSION)
+        self.assertEqual(migrate_database(self.db_path), 0)
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], LATEST_VERSION)
+            validate_db_schema(conn)
+            verify_schema(conn)
+            self.assertEqual(conn.execute("SELECT currency FROM Settings").fetchone()[0], 'USD')
+
+    def test_unmigrated_database_fails_validation(self):
+        with sqlite3.connect(self.db_path) as conn:
+            with self.assertRaises(RuntimeError):
+                validate_db_schema(conn)
+
+    def test_legacy_database_is_upgraded(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''CREATE TABLE Invoices (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date_generated TEXT NOT NULL,
+                invoice_number TEXT UNIQUE NOT NULL,
+                owner TEXT,
+                full_amount_pending REAL NOT NULL,
+                payment_collected REAL DEFAULT 0,
+                date_of_payment TEXT,
+                date_of_last_payment TEXT,
+                payment_method TEXT,
+                outstanding REAL GENERATED ALWAYS AS (full_amount_pending - payment_collected) VIRTUAL
+            )''')
+            conn.executemany('''INSERT INTO Invoices (date_generated, invoice_number, full_amount_pending)
+                VALUES (?, ?, ?)''', [(f'2023-05-{i:02d}', f'INV-{i}', 12.34) for i in range(1, 11)])
+
+        steps = []
+        conn = sqlite3.connect(self.db_path)
+        try:
+            migrate(conn, progress=lambda step, done, total: steps.append(step))
+            validate_db_schema(conn)
+            self.assertIn('Invoices', steps)
+            self.assertEqual(conn.execute("SELECT SUM(full_amount_pending) FROM Invoices").fetchone()[0], 12340)
+        finally:
+            conn.close()
+
+    def test_invoices_reusing_archived_ids_are_renumbered(self):
+        migrate_database(self.db_path)
+        with sqlite3.connect(archive_path_for(self.db_path)) as archive:
+            archive.execute(INVOICES_TABLE.format(table='Invoices'))
+            archive.execute("INSERT INTO Invoices (id, date_generated, invoice_number) VALUES (1, 0, 'A-1')")
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("INSERT INTO Invoices (id, date_generated, invoice_number) VALUES (1, 0, 'L-1')")
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = 'Invoices'")
+            conn.execute("PRAGMA user_version = 5")
+        self.assertEqual(migrate_database(self.db_path), 1)
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute("SELECT id FROM Invoices WHERE invoice_number = 'L-1'").fetchone()[0], 2)
+            conn.execute("INSERT INTO Invoices (date_generated, invoice_number) VALUES (0, 'L-2')")
+            self.assertEqual(conn.execute("SELECT MAX(id) FROM Invoices").fetchone()[0], 3)
+            verify_schema(conn)
+
+    def test_ddl_changed_without_migration_fails(self):
+        migrate_database(self.db_path)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE SchemaInfo SET fingerprint = 'stale'")
+        with self.assertRaisesRegex(RuntimeError, "without a new migration"):
+            migrate_database(self.db_path)
+        with sqlite3.connect(self.db_path) as conn:
+            with self.assertRaises(RuntimeError):
+                validate_db_schema(conn)
+
+    def test_missing_schema_info_is_recorded(self):
+        migrate_database(self.db_path)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DROP TABLE SchemaInfo")
+        self.assertEqual(migrate_database(self.db_path), 0)
+        with sqlite3.connect(self.db_path) as conn:
+            verify_schema(conn)
+
+    def test_catalog_drift_is_detected(self):
+        migrate_database(self.db_path)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("CREATE INDEX idx_owner ON Invoices (owner)")
+            validate_db_schema(conn)
+            with self.assertRaises(RuntimeError):
+                verify_schema(conn)
+
+    def test_unencoded_values_are_rejected(self):
+        migrate_database(self.db_path)
+        with sqlite3.connect(self.db_path) as conn:
+            with self.assertRaisesRegex(sqlite3.DatabaseError, "Full amount must be numeric"):
+                conn.execute('''INSERT INTO Invoices (date_generated, invoice_number, full_amount_pending)
+                    VALUES (19800, 'INV-1', 10.5)''')
+            with self.assertRaisesRegex(sqlite3.DatabaseError, "Invalid isoformat date"):
+                conn.execute('''INSERT INTO Invoices (date_generated, invoice_number, full_amount_pending)
+                    VALUES ('2024-01-01', 'INV-1', 1050)''')
+            conn.execute('''INSERT INTO Invoices (date_generated, invoice_number, full_amount_pending)
+                VALUES (19800, 'INV-1', 1050)''')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import sqlite3
+from decimal import Decimal
+from database.models import Invoice
+from database.settings import AppSettings, SettingsService, date_formatter, money_formatter
+from db_fixtures import DatabaseTestCase
+
+class TestSettingsService(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = SettingsService(self.db_path)
+        self.received = []
+
+    def tearDown(self):
+        self.service.close()
+        super().tearDown()
+
+    def test_defaults_are_loaded_once(self):
+        queries = []
+        self.service.connection.set_trace_callback(queries.append)
+        settings = self.service.current
+        self.assertEqual(settings.currency, 'USD')
+        self.assertIn('Card', settings.payment_methods)
+        self.assertIs(self.service.current, settings)
+        self.assertFalse(self.service.refresh())
+        self.assertEqual(sum('FROM Settings' in sql for sql in queries), 1)
+
+    def test_update_notifies_subscribers(self):
+        self.service.subscribe(self.received.append)
+        self.service.update(currency='eur', payment_methods='Cash, Card,Cash')
+        self.assertEqual([s.currency for s in self.received], ['USD', 'EUR'])
+        self.assertEqual(self.received[-1].payment_methods, ('Cash', 'Card'))
+        self.service.update(currency='EUR')  # no change, no notification
+        self.assertEqual(len(self.received), 2)
+        with self.assertRaises(ValueError):
+            self.service.update(date_format='nonsense')
+
+        reloaded = SettingsService(self.db_path)
+        self.assertEqual(reloaded.current.currency, 'EUR')
+        reloaded.close()
+
+    def test_external_change_is_picked_up(self):
+        self.service.subscribe(self.received.append)
+        with sqlite3.connect(self.db_path, uri=self.db_path.startswith('file:')) as conn:
+            conn.execute("UPDATE Settings SET date_format = 'DD/MM/YYYY'")
+        conn.close()
+        self.assertTrue(self.service.refresh())
+        self.assertEqual(self.received[-1].date_format, 'DD/MM/YYYY')
+
+class TestFormatters(unittest.TestCase):
+    def test_compiled_formatters(self):
+        self.assertEqual(date_formatter('DD/MM/YYYY')('2024-03-09'), '09/03/2024')
+        self.assertEqual(date_formatter('MM.DD.YY')('2024-03-09'), '03.09.24')
+        self.assertEqual(date_formatter('YYYY-MM-DD')(None), '')
+        self.assertIs(date_formatter('DD/MM/YYYY'), date_formatter('DD/MM/YYYY'))
+        self.assertEqual(money_formatter('AED')(Decimal('1234.5')), 'AED 1,234.50')
+
+    def test_row_formatter(self):
+        settings = AppSettings.build('usd', 'DD/MM/YYYY', 'Cash')
+        invoice = Invoice(7, '2024-03-09', 'INV-7', None, Decimal('10'), None,
+                          None, None, None, Decimal('10'))
+        self.assertEqual(settings.row_formatter()(invoice), (7, '09/03/2024', 'INV-7', '', 'USD 10.00'))
+        self.assertEqual(settings.row_formatter(('owner',))(invoice), ('',))
+
+class TestSettingsServiceInMemory(TestSettingsService):
+    in_memory = True
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import sqlite3
+from database.archive_manager import ArchiveManager
+from database.invoice_store import InvoiceFilter, InvoiceStore
+from database.unit_of_work import GroupCommitter, WriteError
+from db_fixtures import DatabaseTestCase
+
+class TestUnitOfWork(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = InvoiceStore(self.db_path, ArchiveManager(self.db_path, self.archive_path))
+        with self.store.unit_of_work() as uow:
+            for i in range(1, 6):
+                uow.add({'date_generated': '2024-01-01', 'invoice_number': f'INV-{i}',
+                         'owner': 'Old Clinic', 'full_amount_pending': '100'})
+        self.commits = []
+        self.store.connection.set_trace_callback(
+            lambda sql: sql == 'RELEASE unit_of_work' and self.commits.append(sql))
+
+    def tearDown(self):
+        self.store.close()
+        super().tearDown()
+
+    def test_failed_operation_is_reported_and_rest_commits(self):
+        with self.store.unit_of_work() as uow:
+            uow.add({'date_generated': '2024-01-02', 'invoice_number': 'INV-6', 'full_amount_pending': '5'})
+            uow.add({'date_generated': '2024-01-02', 'invoice_number': 'INV-1', 'full_amount_pending': '5'})
+            uow.update(1, {'payment_collected': '500'})
+        self.assertEqual(len(uow.result.applied), 1)
+        self.assertEqual([error[0] for error in uow.result.errors], [1, 2])
+        self.assertEqual(len(self.store.find(InvoiceFilter.build())), 6)
+        self.assertEqual(len(self.commits), 1)
+
+    def test_deleting_a_missing_invoice_is_an_error(self):
+        with self.store.unit_of_work() as uow:
+            uow.delete(99)
+            uow.delete(1)
+        self.assertEqual(uow.result.applied, ["Invoice #1 deleted"])
+        self.assertEqual(uow.result.errors, [(0, "Invoice #99 deleted", "Invoice #99 not found")])
+
+    def test_failed_commit_is_reported_and_rolled_back(self):
+        results = []
+        committer = GroupCommitter(self.store, on_batch=results.append)
+        self.store.connection.execute("PRAGMA busy_timeout = 0")
+        reader = sqlite3.connect(self.db_path)
+        try:
+            reader.execute("BEGIN")
+            reader.execute("SELECT COUNT(*) FROM Invoices").fetchall()
+            committer.submit('delete', 1)
+            result = committer.flush()
+        finally:
+            reader.close()
+        self.assertFalse(result.ok)
+        self.assertEqual(results, [result])
+        self.assertIn("not saved", result.summary())
+        self.assertFalse(self.store.connection.in_transaction)
+
+        committer.submit('delete', 2)
+        self.assertTrue(committer.flush().ok)
+        self.assertEqual([inv.id for inv in self.store.find(InvoiceFilter.build())], [1, 3, 4, 5])
+
+    def test_strict_unit_rolls_back_everything(self):
+        with self.assertRaises(WriteError):
+            with self.store.unit_of_work(strict=True) as uow:
+                uow.delete(2)
+                uow.update(1, {'full_amount_pending': 'not a number'})
+        self.assertIsNotNone(self.store.get(2))
+
+    def test_bulk_update_by_filter(self):
+        old_filter = InvoiceFilter.build(owner='Old Clinic')
+        self.assertEqual(len(self.store.find(old_filter)), 5)
+        with self.store.unit_of_work() as uow:
+            self.assertEqual(uow.update_where(old_filter, {'owner': 'New Clinic'}), 5)
+        self.assertEqual(self.store.find(old_filter), ())
+        self.assertEqual(len(self.store.find(InvoiceFilter.build(owner='New Clinic'))), 5)
+
+    def test_group_commit_coalesces_submissions(self):
+        scheduled, batches = [], []
+        writer = GroupCommitter(self.store, schedule=lambda ms, callback: scheduled.append(callback),
+                                on_batch=batches.append)
+        for invoice_id in (1, 2, 3):
+            writer.submit('delete', invoice_id)
+        self.assertEqual(len(scheduled), 1)
+        scheduled[0]()
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batches[0].summary(), "3 changes saved")
+        self.assertEqual(len(self.commits), 1)
+        self.assertEqual(len(self.store.find(InvoiceFilter.build())), 2)
+
+if __name__ == '__main__':
+    unittest.main()